@@ -1,11 +1,22 @@
-from flask import Blueprint, jsonify, request
-from ai_module.utils._openai import message_generator
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from ai_module.utils._openai import message_generator, generate_messages_batch, message_generator_stream_async,\
+message_cache, MESSAGE_CACHE_ENABLED,\
+semantic_cache, SEMANTIC_CACHE_ENABLED, variant_pool, VARIANT_POOL_ENABLED, structured_output_snapshot,\
+generation_flight, GENERATION_COALESCING_ENABLED, prompt_template_snapshot
 from ai_module.utils.utils_card import generate_card_png, generate_card_pdf
 from ai_module.utils.envelope_util import create_envelopes_from_json, setup_fonts
-from ai_module.utils.utils import load_config
+from ai_module.utils.font_registry import font_registry
+from ai_module.utils.letter_layout import layout_cache_info
+from ai_module.utils.utils import load_config, warm_up_occasion_spirits, spirit_cache, spirit_flight,\
+SPIRIT_COALESCING_ENABLED
+from ai_module.utils.llm_client import iterate_sync, usage_tracker, client_snapshot, circuit_breaker,\
+LLM_CIRCUIT_BREAKER_ENABLED, rate_limiter, LLM_RATE_LIMIT_ENABLED
+from ai_module.utils.helpers import sse_event
+from ai_module.utils.schemas import normalize_styles
 
 from ai_module.utils.log_config import setup_logging
 import logging
+import threading
 import json
 import os
 
@@ -35,6 +46,15 @@ try:
 except Exception as e:
     logging.error(f"Error setting up fonts: {e}")
 
+# Warm up the spirit cache for occasions that are not built in, without blocking startup
+warmup_occasions = [o.strip() for o in config.get('OCCASIONS', 'warmup', fallback='').split(',') if o.strip()]
+if warmup_occasions:
+    threading.Thread(target=warm_up_occasion_spirits, args=(warmup_occasions,), daemon=True).start()
+
+# Keep pre-generated message sets ready for the configured popular combinations
+if VARIANT_POOL_ENABLED:
+    variant_pool.start()
+
 @api_blueprint.route('/hello')
 def hello():
     return jsonify({'message': 'Hello from the API!'})
@@ -50,25 +70,144 @@ def generate_message():
         gender = data.get('gender')
         character_traits = data.get('character_traits')
         message_theme = data.get('message_theme')
+        seed = data.get('seed')
+        styles = normalize_styles(data.get('styles'))
+        length_budget = data.get('length_budget')
 
-        # Unpack the returned tuple from message_generator into four variables
-        normal_1_paragraph, normal_2_paragraphs, short_and_sweet, poem = message_generator(
-            name, relationship, occasion, birthday, gender, character_traits, message_theme
+        result = message_generator(
+            name, relationship, occasion, birthday, gender, character_traits, message_theme, seed, styles, length_budget
         )
+        # Unpack the returned tuple from message_generator into four variables
+        normal_1_paragraph, normal_2_paragraphs, short_and_sweet, poem = result
 
-        # Construct and return the JSON response
-        return jsonify({
+        messages = {
             "Normal1Paragraph": normal_1_paragraph,
             "Normal2Paragraphs": normal_2_paragraphs,
             "ShortAndSweet": short_and_sweet,
             "Poem": poem
-        }), 200
+        }
+
+        # Construct and return the JSON response with the requested styles, flagging template fallbacks
+        response = {style: messages[style] for style in styles}
+        if getattr(result, 'fallback', False):
+            response['fallback'] = True
+        return jsonify(response), 200
 
     except Exception as e:
         logging.error(f"Error in generate_message: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 400
     
 
+@api_blueprint.route('/generate_message_stream', methods=['POST'])
+def generate_message_stream():
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': 'No JSON data provided'}), 400
+
+    def events():
+        try:
+            stream = message_generator_stream_async(
+                data.get('name'), data.get('relationship'), data.get('occasion'), data.get('birthday'),
+                data.get('gender'), data.get('character_traits'), data.get('message_theme'), data.get('seed')
+            )
+            for style, message in iterate_sync(stream):
+                payload = {'style': style, 'message': message}
+                if getattr(message, 'fallback', False):
+                    payload['fallback'] = True
+                yield sse_event(style, payload)
+            yield sse_event('done', {})
+        except Exception as e:
+            logging.error(f"Error in generate_message_stream: {e}", exc_info=True)
+            yield sse_event('error', {'error': str(e)})
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@api_blueprint.route('/generate_messages_batch', methods=['POST'])
+def generate_messages_batch_():
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No JSON data provided'}), 400
+
+        results = generate_messages_batch(data.get('recipients'), data.get('concurrency'))
+
+        return jsonify({'results': results}), 200
+
+    except Exception as e:
+        logging.error(f"Error in generate_messages_batch: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 400
+
+
+@api_blueprint.route('/message_cache_stats', methods=['GET'])
+def message_cache_stats():
+    return jsonify(dict(message_cache.snapshot(), enabled=MESSAGE_CACHE_ENABLED)), 200
+
+
+@api_blueprint.route('/semantic_cache_stats', methods=['GET'])
+def semantic_cache_stats():
+    return jsonify(dict(semantic_cache.snapshot(), enabled=SEMANTIC_CACHE_ENABLED)), 200
+
+
+@api_blueprint.route('/variant_pool_stats', methods=['GET'])
+def variant_pool_stats():
+    return jsonify(dict(variant_pool.snapshot(), enabled=VARIANT_POOL_ENABLED)), 200
+
+
+@api_blueprint.route('/structured_output_stats', methods=['GET'])
+def structured_output_stats():
+    return jsonify(structured_output_snapshot()), 200
+
+
+@api_blueprint.route('/prompt_template_stats', methods=['GET'])
+def prompt_template_stats():
+    return jsonify(prompt_template_snapshot()), 200
+
+
+@api_blueprint.route('/llm_usage_stats', methods=['GET'])
+def llm_usage_stats():
+    return jsonify(usage_tracker.snapshot()), 200
+
+
+@api_blueprint.route('/llm_client_stats', methods=['GET'])
+def llm_client_stats():
+    return jsonify(client_snapshot()), 200
+
+
+@api_blueprint.route('/circuit_breaker_stats', methods=['GET'])
+def circuit_breaker_stats():
+    return jsonify(dict(circuit_breaker.snapshot(), enabled=LLM_CIRCUIT_BREAKER_ENABLED)), 200
+
+
+@api_blueprint.route('/rate_limiter_stats', methods=['GET'])
+def rate_limiter_stats():
+    return jsonify(dict(rate_limiter.snapshot(), enabled=LLM_RATE_LIMIT_ENABLED)), 200
+
+
+@api_blueprint.route('/coalescing_stats', methods=['GET'])
+def coalescing_stats():
+    return jsonify({
+        "generations": dict(generation_flight.snapshot(), enabled=GENERATION_COALESCING_ENABLED),
+        "occasion_spirits": dict(spirit_flight.snapshot(), enabled=SPIRIT_COALESCING_ENABLED)
+    }), 200
+
+
+@api_blueprint.route('/font_registry_stats', methods=['GET'])
+def font_registry_stats():
+    return jsonify(font_registry.snapshot()), 200
+
+
+@api_blueprint.route('/layout_cache_stats', methods=['GET'])
+def layout_cache_stats():
+    return jsonify(layout_cache_info()), 200
+
+
+@api_blueprint.route('/occasion_spirit_stats', methods=['GET'])
+def occasion_spirit_stats():
+    return jsonify(spirit_cache.snapshot()), 200
+
+
 # @api_blueprint.route('/generate_card_old', methods=['POST'])
 # def generate_card():
 #     try:
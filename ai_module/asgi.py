@@ -0,0 +1,140 @@
+"""
+ASGI entry point that serves message generation from an event loop.
+
+The generation routes are handled natively as coroutines, so one process can hold
+hundreds of in-flight LLM calls concurrently. Every other route is delegated to the
+regular Flask app. Run with e.g.:
+
+    uvicorn ai_module.asgi:app --host 0.0.0.0 --port 6000
+"""
+from asgiref.wsgi import WsgiToAsgi
+import logging
+import json
+
+from ai_module import create_app
+from ai_module.utils._openai import message_generator_async, generate_messages_batch_async, message_generator_stream_async
+from ai_module.utils.helpers import sse_event
+from ai_module.utils.schemas import normalize_styles
+
+flask_app = WsgiToAsgi(create_app())
+
+
+async def read_json(receive):
+    """
+    Reads the full request body and decodes it as JSON.
+    """
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return json.loads(body or b"null")
+
+
+async def send_json(send, payload, status=200):
+    """
+    Sends a JSON response.
+    """
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def generate_message(scope, receive, send):
+    try:
+        data = await read_json(receive)
+        styles = normalize_styles(data.get('styles'))
+        result = await message_generator_async(
+            data.get('name'), data.get('relationship'), data.get('occasion'), data.get('birthday'),
+            data.get('gender'), data.get('character_traits'), data.get('message_theme'), data.get('seed'),
+            styles, data.get('length_budget')
+        )
+        normal_1_paragraph, normal_2_paragraphs, short_and_sweet, poem = result
+        messages = {
+            "Normal1Paragraph": normal_1_paragraph,
+            "Normal2Paragraphs": normal_2_paragraphs,
+            "ShortAndSweet": short_and_sweet,
+            "Poem": poem
+        }
+        response = {style: messages[style] for style in styles}
+        if getattr(result, 'fallback', False):
+            response['fallback'] = True
+        await send_json(send, response)
+    except Exception as e:
+        logging.error(f"Error in generate_message: {e}", exc_info=True)
+        await send_json(send, {'error': str(e)}, status=400)
+
+
+async def generate_message_stream(scope, receive, send):
+    try:
+        data = await read_json(receive)
+    except ValueError:
+        data = None
+    if not data:
+        await send_json(send, {'error': 'No JSON data provided'}, status=400)
+        return
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")]
+    })
+    try:
+        stream = message_generator_stream_async(
+            data.get('name'), data.get('relationship'), data.get('occasion'), data.get('birthday'),
+            data.get('gender'), data.get('character_traits'), data.get('message_theme'), data.get('seed')
+        )
+        async for style, message in stream:
+            payload = {'style': style, 'message': message}
+            if getattr(message, 'fallback', False):
+                payload['fallback'] = True
+            event = sse_event(style, payload)
+            await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+        event = sse_event('done', {})
+    except Exception as e:
+        logging.error(f"Error in generate_message_stream: {e}", exc_info=True)
+        event = sse_event('error', {'error': str(e)})
+    await send({"type": "http.response.body", "body": event.encode("utf-8")})
+
+
+async def generate_messages_batch(scope, receive, send):
+    try:
+        data = await read_json(receive)
+        if not data:
+            await send_json(send, {'error': 'No JSON data provided'}, status=400)
+            return
+        results = await generate_messages_batch_async(data.get('recipients'), data.get('concurrency'))
+        await send_json(send, {'results': results})
+    except Exception as e:
+        logging.error(f"Error in generate_messages_batch: {e}", exc_info=True)
+        await send_json(send, {'error': str(e)}, status=400)
+
+
+# Routes served natively on the event loop, keyed by (method, path)
+async_routes = {
+    ('POST', '/api/generate_message'): generate_message,
+    ('POST', '/api/generate_message_stream'): generate_message_stream,
+    ('POST', '/api/generate_messages_batch'): generate_messages_batch,
+}
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    handler = async_routes.get((scope.get('method'), scope.get('path')))
+    if scope['type'] == 'http' and handler is not None:
+        await handler(scope, receive, send)
+    else:
+        await flask_app(scope, receive, send)
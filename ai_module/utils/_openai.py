@@ -1,152 +1,351 @@
 from datetime import datetime
-from openai import OpenAI
+import threading
 import logging
+import asyncio
+import time
 import os
 import random
 
 from ai_module.utils.helpers import calculate_age
+from ai_module.utils.llm_client import chat_completion_async, run_sync, llm_deadline, usage_tracker
+from ai_module.utils.circuit_breaker import CircuitOpenError
+from ai_module.utils.fallback_messages import FallbackMessages, FallbackMessage, generate_fallback_messages
+from ai_module.utils.message_cache import MessageCache, build_message_key
+from ai_module.utils.semantic_cache import SemanticMessageCache
+from ai_module.utils.variant_pool import VariantPool, parse_combinations
+from ai_module.utils.stream_parser import StreamingMessageParser
+from ai_module.utils.singleflight import SingleFlight
+from ai_module.utils.prompt_templates import PromptRegistry, STYLE_COUNT_WORDS, poem_format, parse_weights
+from ai_module.utils.schemas import STYLES, build_response_format, normalize_styles,\
+resolve_length_budget, estimate_max_tokens, MIN_POEM_LINES
+from ai_module.utils.occasions import lookup_occasion, normalize_key
 from ai_module.utils.utils import load_config, extract_messages, select_random_themes,\
-select_random_traits, get_core_of_the_event, get_important_traits
+select_random_traits, get_core_of_the_event_async, personalize_messages, name_is_personalizable,\
+extract_messages_with_validity
 
 # Load configuration
 config = load_config()
 
 os.environ['OPENAI_API_KEY'] = config['OPENAI']['OPENAI_API_KEY']
-api = config['OPENAI']['GOOGLE_API_KEY']
 
+# Maximum number of recipients generated concurrently in one batch
+BATCH_CONCURRENCY = config.getint('BATCH', 'concurrency', fallback=16)
+BATCH_MAX_RECIPIENTS = config.getint('BATCH', 'max_recipients', fallback=500)
 
-def gpt_res(name, relationship, occasion, birthday, gender, random_traits, random_message_themes):
-    logging.info("Generating GPT response...")
-    logging.info(f"Name: {name}")
-    logging.info(f"Relationship: {relationship}")
-    logging.info(f"Occasion: {occasion}")
-    logging.info(f"Birthday: {birthday}")
-    logging.info(f"Gender: {gender}")
-    logging.info(f"Traits: {random_traits}")
-    logging.info(f"Themes: {random_message_themes}")
-    logging.info(f"Core of the event: {get_core_of_the_event(occasion)}")
+# Optional cache of generated message sets, keyed on the normalized request and seed
+MESSAGE_CACHE_ENABLED = config.getboolean('MESSAGE_CACHE', 'enabled', fallback=False)
+message_cache = MessageCache(
+    max_entries=config.getint('MESSAGE_CACHE', 'max_entries', fallback=1024),
+    ttl_seconds=config.getint('MESSAGE_CACHE', 'ttl_seconds', fallback=3600)
+)
 
+# Optional near-duplicate cache that reuses message sets of similar requests
+SEMANTIC_CACHE_ENABLED = config.getboolean('SEMANTIC_CACHE', 'enabled', fallback=False)
+semantic_cache = SemanticMessageCache(
+    threshold=config.getfloat('SEMANTIC_CACHE', 'threshold', fallback=0.9),
+    max_entries=config.getint('SEMANTIC_CACHE', 'max_entries', fallback=2048)
+)
 
-    # Calculate age
-    today_date = datetime.now().date()
-    age_years, _ = calculate_age(birthday, today_date)
-    logging.info(f"Age: {age_years}")
+# Concurrent identical generation requests share one upstream completion
+GENERATION_COALESCING_ENABLED = config.getboolean('COALESCING', 'generations', fallback=True)
+generation_flight = SingleFlight()
 
-    # Create OpenAI client
-    logging.info("Creating OpenAI client...")
-    # client = OpenAI()
-    client = OpenAI(
-        api_key=api,
-        base_url="https://generativelanguage.googleapis.com/v1beta/openai/"
-    )
-    
-    prompt1 = """
-    Create four styles of greeting card messages for a {relationship} on the occasion of {occasion}, considering their personality trait, our relationship, and the spirit of the event as described:
-    
-    Spirit of the Event: {spirit_of_event}
-    
-    - Message 1: Normal, 1 paragraph, themed "{message_theme_1}", including trait "{trait_1}" and capturing the spirit of {occasion}.
-    - Message 2: Normal, 2 paragraphs, themed "{message_theme_2}", including trait "{trait_2}". Each paragraph should not exceed 20 words and should capture the essence of {occasion}.
-    - Message 3: Short and sweet, themed "{message_theme_3}", with trait "{trait_3}" and reflecting the spirit of {occasion}.
-    - Message 4: Poem style, themed "{message_theme_4}", reflecting trait "{trait_4}" and the spirit of {occasion}. Comprise 4 lines. Max 12 words per stanza
+# Optional pool of pre-generated message sets for popular occasion x relationship combinations
+VARIANT_POOL_ENABLED = config.getboolean('VARIANT_POOL', 'enabled', fallback=False)
+VARIANT_POOL_THEMES = [t.strip() for t in config.get(
+    'VARIANT_POOL', 'themes', fallback='Heartwarming, Sentimental, Inspirational, Humorous').split(',') if t.strip()]
 
 
-    Each message should be 5-40 words long, no shorter than one sentence and no longer than three sentences. Include new lines between lines, paragraphs, and stanzas. 
-    
-    The messages are tailored for events around Christmas, New Year's, Easter, and Thanksgiving to capture more of the spirit of the event versus concentrating on the person alone.
-    
-    Don't Forget:
-    Each message should be clear, impactful, and appropriately themed. The messages are tailored for {occasion} to capture the spirit of the event.
+async def generate_pool_variant(occasion, relationship, gender):
+    """
+    Generates one name- and age-neutral message set for the variant pool, using the
+    occasion's important traits and the configured pool themes.
+    """
+    rng = random.Random()
+    important_traits = lookup_occasion(occasion)['important_traits']
+    random_trait = select_random_traits(important_traits, important_traits, rng=rng)
+    random_theme = select_random_themes(VARIANT_POOL_THEMES, rng=rng)
+    response = await gpt_res_async(None, relationship, occasion, None, gender, random_trait, random_theme, rng,
+                                   purpose="variant_pool")
+    return extract_messages(response)
+
+
+variant_pool = VariantPool(
+    generate_pool_variant,
+    parse_combinations(config.get('VARIANT_POOL', 'combinations', fallback='')),
+    pool_size=config.getint('VARIANT_POOL', 'pool_size', fallback=20),
+    refill_interval=config.getfloat('VARIANT_POOL', 'refill_interval_seconds', fallback=1.0),
+    concurrency=config.getint('VARIANT_POOL', 'refill_concurrency', fallback=4),
+    max_backoff=config.getfloat('VARIANT_POOL', 'max_backoff_seconds', fallback=60.0)
+)
+
+# Response keys of the four message styles, in the order message_generator returns them
+MESSAGE_STYLES = STYLES
+
+# Prompt variants, compiled once; [PROMPTS] weights overrides how often each is picked
+prompt_registry = PromptRegistry(weights=parse_weights(config.get('PROMPTS', 'weights', fallback='')))
+
+# Structured output: "json_schema" or "json_object" where the provider supports it, "off" otherwise
+STRUCTURED_OUTPUT = config.get('LLM', 'structured_output', fallback='off').strip().lower()
+
+# Parse failure, field repair and full retry counters of the message responses, with or without structured output
+structured_stats = {
+    "responses": 0, "parse_failures": 0, "invalid_responses": 0, "invalid_fields": 0,
+    "repairs": 0, "repaired_fields": 0, "repair_failures": 0, "full_retries": 0,
+    "completion_seconds": 0.0, "repair_seconds": 0.0
+}
+structured_stats_lock = threading.Lock()
+
+# Recipient fields accepted by message_generator
+RECIPIENT_FIELDS = ("name", "relationship", "occasion", "birthday", "gender", "character_traits", "message_theme")
+
+
+def gpt_res(name, relationship, occasion, birthday, gender, random_traits, random_message_themes, rng=None,
+            styles=STYLES, length_budget=None):
+    """
+    Synchronous wrapper around gpt_res_async.
+    """
+    return run_sync(gpt_res_async(name, relationship, occasion, birthday, gender, random_traits, random_message_themes, rng,
+                                  styles, length_budget))
 
 
-    Details:
-    Gender: {gender}
-    {relationship}'s Age: {age_years}
-    
+async def gpt_res_async(name, relationship, occasion, birthday, gender, random_traits, random_message_themes, rng=None,
+                        styles=STYLES, length_budget=None, purpose="messages"):
+    messages, template = await build_gpt_messages(name, relationship, occasion, birthday, gender, random_traits,
+                                                  random_message_themes, rng, styles, length_budget)
+
+    usage = {"purpose": purpose, "occasion": lookup_occasion(occasion)['name'], "template": template}
+    return await request_gpt_messages(messages, styles, length_budget, usage)
+
 
-    Output Format (in JSON):
-    {{
-        "Normal1Paragraph": {{"Trait": "{trait_1}", "Theme": "{message_theme_1}", "Message": "<Message>"}},
-        "Normal2Paragraphs": {{"Trait": "{trait_2}", "Theme": "{message_theme_2}", "para1": "<paragraph 1>", "para2": "<paragraph 2>"}},
-        "ShortAndSweet": {{"Trait": "{trait_3}", "Theme": "{message_theme_3}", "Message": "<Message>"}},
-        "Poem": {{"Trait": "{trait_4}", "Theme": "{message_theme_4}", "line1": "<Opening line>", "line2": "<line 2>", "line3": "<line 3>", "line4": "<Closing line>"}}
-    }}
+async def request_gpt_messages(messages, styles=STYLES, length_budget=None, usage=None):
     """
+    Sends the greeting card chat messages and returns the response text, requesting
+    structured output when it is configured.
 
-    prompt2 = """
-    Create four styles of greeting card messages for a {relationship} on the occasion of {occasion}, considering their personality trait, our relationship, and the spirit of the event as described:
-    
-    Spirit of the Event: {spirit_of_event}
+    usage holds the purpose, occasion and template the call is accounted to.
+    """
+    logging.info("Calling OpenAI API...")
+    completion = await chat_completion_async(messages=messages, usage=usage, **completion_kwargs(styles, length_budget))
     
-    - Message 1: Normal, 1 paragraph, themed "{message_theme_1}", including trait "{trait_1}" and capturing the spirit of {occasion}.
-    - Message 2: Normal, 2 paragraphs, themed "{message_theme_2}", including trait "{trait_2}". Each paragraph should not exceed 20 words and should capture the essence of {occasion}.
-    - Message 3: Short and sweet, themed "{message_theme_3}", with trait "{trait_3}" and reflecting the spirit of {occasion}.
-    - Message 4: Poem style, themed "{message_theme_4}", reflecting trait "{trait_4}" and the spirit of {occasion}. Comprise 8 lines. Max 12 words per stanza
+    logging.info("Full Response:")
+    logging.info(completion)
 
+    # Content can be None, e.g. on a safety block; an empty response is repaired like any invalid one
+    return completion.choices[0].message.content or ""
 
-    Each message should be 5-40 words long, no shorter than one sentence and no longer than three sentences. Include new lines between lines, paragraphs, and stanzas. 
-    
-    The messages are tailored for events around Christmas, New Year's, Easter, and Thanksgiving to capture more of the spirit of the event versus concentrating on the person alone.
-    
-    Don't Forget:
-    Each message should be clear, impactful, and appropriately themed. The messages are tailored for {occasion} to capture the spirit of the event.
 
+def completion_kwargs(styles=STYLES, length_budget=None):
+    """
+    Returns the extra completion arguments for the requested styles: max_tokens sized to
+    their length budget when one was given, and the response_format of the configured
+    structured-output mode.
+    """
+    kwargs = {}
+    if length_budget:
+        kwargs["max_tokens"] = estimate_max_tokens(resolve_length_budget(styles, length_budget))
+    response_format = build_response_format(STRUCTURED_OUTPUT, styles)
+    if response_format:
+        kwargs["response_format"] = response_format
+    return kwargs
 
-    Details:
-    Gender: {gender}
-    {relationship}'s Age: {age_years}
-    
 
-    Output Format (in JSON):
-    {{
-        "Normal1Paragraph": {{"Trait": "{trait_1}", "Theme": "{message_theme_1}", "Message": "<Message>"}},
-        "Normal2Paragraphs": {{"Trait": "{trait_2}", "Theme": "{message_theme_2}", "para1": "<paragraph 1>", "para2": "<paragraph 2>"}},
-        "ShortAndSweet": {{"Trait": "{trait_3}", "Theme": "{message_theme_3}", "Message": "<Message>"}},
-        "Poem": {{"Trait": "{trait_4}", "Theme": "{message_theme_4}", "line1": "<Opening line>", "line2": "<line 2>", "line3": "<line 3>", "line4": "<line 4>", "line5": "<line 5>", "line6": "<line 6>", "line7": "<line 7>", "line8": "<Closing line>"}}
-    }}
-    """
-
-    prompts = [prompt1, prompt2]
-
-    # Select a random prompt
-    prompt = random.choice(prompts)
-
-    prompt = prompt.format(
-        message_theme_1=random_message_themes[0],
-        trait_1=random_traits[0],
-        message_theme_2=random_message_themes[1],
-        trait_2=random_traits[1],
-        message_theme_3=random_message_themes[2],
-        trait_3=random_traits[2],
-        message_theme_4=random_message_themes[3],
-        trait_4=random_traits[3],
+def keep_styles(messages, styles):
+    """
+    Blanks the messages of the styles that were not requested.
+
+    Returns:
+    tuple: The four messages in MESSAGE_STYLES order.
+    """
+    return tuple(message if style in styles else "" for style, message in zip(MESSAGE_STYLES, messages))
+
+
+async def parse_messages_response(messages, response, styles=STYLES, length_budget=None, usage=None):
+    """
+    Parses a response, checking each requested style on its own.
+
+    Styles that are missing or invalid are asked for again with one follow-up completion
+    that requests only those styles, and are merged with the valid ones. A response
+    without any usable style goes through the same repair, for every requested style.
+
+    Args:
+    messages (list): Chat messages that produced the response.
+    response (str): The response text.
+    styles (tuple): Requested styles.
+    length_budget (dict): Optional style -> maximum words of the request.
+    usage (dict): Labels the repair call is accounted to.
+
+    Returns:
+    tuple: The four message strings.
+    """
+    extracted, validity, parsed = extract_messages_with_validity(response, styles)
+    missing = [style for style, valid in validity.items() if not valid]
+    with structured_stats_lock:
+        structured_stats["responses"] += 1
+        structured_stats["parse_failures"] += 1 if parsed is None else 0
+        if missing:
+            structured_stats["invalid_responses"] += 1
+            structured_stats["invalid_fields"] += len(missing)
+    if not missing:
+        return extracted
+
+    # Counted apart, as a repair of every style costs as much as regenerating the set
+    full = len(missing) == len(styles)
+    logging.warning(f"Response is missing or has invalid {missing}, repairing them...")
+    start = time.monotonic()
+    repaired, repaired_validity = await repair_styles(messages, response, missing, length_budget, usage)
+    fixed = [style for style, valid in repaired_validity.items() if valid]
+    extracted = tuple(repaired[index] if style in fixed else message
+                      for index, (style, message) in enumerate(zip(MESSAGE_STYLES, extracted)))
+    with structured_stats_lock:
+        structured_stats["full_retries" if full else "repairs"] += 1
+        if not full:
+            structured_stats["repair_seconds"] += time.monotonic() - start
+        structured_stats["repaired_fields"] += len(fixed)
+        if len(fixed) < len(missing):
+            structured_stats["repair_failures"] += 1
+    return extracted
+
+
+async def repair_styles(messages, response, styles, length_budget=None, usage=None):
+    """
+    Asks the model for only the given styles, continuing the original conversation, and
+    parses the reply like the original response.
+
+    Returns:
+    tuple: (the four messages, dict of style -> True if the reply has it valid)
+    """
+    # An empty response adds nothing to continue from
+    previous = [{"role": "assistant", "content": response}] if response and response.strip() else []
+    repair_messages = messages + previous + [
+        {"role": "user", "content": (
+            f"The following messages were missing or incomplete: {', '.join(styles)}. "
+            f"Reply with a JSON object containing only the keys {', '.join(styles)}, "
+            "in the same format as requested above."
+        )}
+    ]
+    try:
+        completion = await chat_completion_async(messages=repair_messages, usage=dict(usage or {}, purpose="repair"),
+                                                 **completion_kwargs(tuple(styles), length_budget))
+        repaired, validity, _ = extract_messages_with_validity(completion.choices[0].message.content or "", styles)
+    except Exception as e:
+        logging.error(f"Repair of {styles} failed: {e}")
+        repaired, validity = ("",) * len(MESSAGE_STYLES), {style: False for style in styles}
+    return repaired, validity
+
+
+def prompt_template_snapshot():
+    """
+    Returns the prompt variants with their estimated token lengths, next to the prompt
+    tokens the provider reported for each of them.
+    """
+    by_template = usage_tracker.snapshot()["by_template"]
+    return {
+        name: dict(stats, reported_average_prompt_tokens=by_template.get(name, {}).get("average_prompt_tokens"))
+        for name, stats in prompt_registry.snapshot().items()
+    }
+
+
+def structured_output_snapshot():
+    """
+    Returns the response parsing counters with the derived parse-failure and repair rates,
+    the share of broken responses fixed by a field repair rather than a full retry, and an
+    estimate of the latency avoided by repairing instead of regenerating everything.
+    """
+    with structured_stats_lock:
+        stats = dict(structured_stats)
+    responses = stats["responses"]
+    average_completion = stats["completion_seconds"] / responses if responses else 0.0
+    stats.update(
+        mode=STRUCTURED_OUTPUT,
+        parse_failure_rate=stats["parse_failures"] / responses if responses else 0.0,
+        repair_rate=stats["repairs"] / responses if responses else 0.0,
+        partial_repair_share=(stats["repairs"] / (stats["repairs"] + stats["full_retries"])
+                              if stats["repairs"] + stats["full_retries"] else 0.0),
+        retry_seconds_avoided=max(stats["repairs"] * average_completion - stats["repair_seconds"], 0.0)
+    )
+    return stats
+
+
+async def build_gpt_messages(name, relationship, occasion, birthday, gender, random_traits, random_message_themes, rng=None,
+                             styles=STYLES, length_budget=None):
+    """
+    Builds the chat messages of the greeting card prompt, including the occasion's spirit.
+
+    Only the sections of the requested styles are included in the prompt.
+
+    Args:
+    styles (tuple): Requested styles, in MESSAGE_STYLES order.
+    length_budget (dict): Optional style -> maximum words. When given, each style is asked to stay within its budget.
+
+    Returns:
+    tuple: (messages, template) with the system and user chat messages and the name of the prompt variant used.
+    """
+    # rng is an optional random.Random so a seed reproduces the prompt choice; defaults to the global generator
+    rng = rng or random
+    logging.info("Generating GPT response...")
+    # The prompt keeps the occasion as the customer wrote it; the registry entry only supplies metadata
+    occasion_info = lookup_occasion(occasion)
+    occasion = " ".join(occasion.split())
+    logging.info(f"Name: {name}")
+    logging.info(f"Relationship: {relationship}")
+    logging.info(f"Occasion: {occasion}")
+    logging.info(f"Birthday: {birthday}")
+    logging.info(f"Gender: {gender}")
+    logging.info(f"Traits: {random_traits}")
+    logging.info(f"Themes: {random_message_themes}")
+    logging.info(f"Styles: {styles}")
+    spirit_of_event = await get_core_of_the_event_async(occasion)
+    logging.info(f"Core of the event: {spirit_of_event}")
+
+
+    # Calculate age; pre-generated pool messages have no birthday and stay age-neutral
+    today_date = datetime.now().date()
+    age_years, _ = calculate_age(birthday, today_date) if birthday else ("unknown", None)
+    logging.info(f"Age: {age_years}")
+
+    # Select a prompt variant among the ones registered for the occasion, by weight
+    template = prompt_registry.choose(occasion_info['prompt_variants'], rng)
+    poem_lines = template.poem_lines
+    budget = resolve_length_budget(styles, length_budget) if length_budget else None
+    if budget and "Poem" in budget:
+        # Keep a short poem budget to a few words per line, but never below the lines a valid poem needs
+        poem_lines = max(MIN_POEM_LINES, min(poem_lines, budget["Poem"] // 4))
+
+    instructions = []
+    output_format = []
+    for number, style in enumerate(styles, 1):
+        index = MESSAGE_STYLES.index(style)
+        values = dict(trait=random_traits[index], theme=random_message_themes[index], occasion=occasion,
+                      poem_lines=poem_lines, poem_format=poem_format(poem_lines))
+        instruction = prompt_registry.style_instructions[style].render(**values)
+        if budget:
+            instruction = instruction.rstrip('.') + f". Use at most {budget[style]} words."
+        instructions.append(f"    - Message {number}: {instruction}")
+        output_format.append("        " + prompt_registry.style_output_formats[style].render(**values))
+
+    if budget:
+        length_rule = "Each message should be no shorter than one sentence and stay within its word limit."
+    else:
+        length_rule = "Each message should be 5-40 words long, no shorter than one sentence and no longer than three sentences."
+
+    messages = prompt_registry.render(
+        template,
+        style_count=STYLE_COUNT_WORDS[len(styles)],
+        instructions="\n".join(instructions),
+        output_format=",\n".join(output_format),
+        length_rule=length_rule,
         occasion=occasion,
         relationship=relationship,
-        today_date=today_date,
-        dob = birthday,
-        name = name,
         gender = gender,
         age_years = age_years,
-        spirit_of_event = get_core_of_the_event(occasion)
+        spirit_of_event = spirit_of_event
     )
 
     logging.info("Prompt:")
-    logging.info(prompt)
-    
-    logging.info("Calling OpenAI API...")
-    completion = client.chat.completions.create(
-    # model="gpt-3.5-turbo",
-    model="gemini-1.5-flash",
-    messages=[
-        {"role": "system", "content": "You are a pro Geeting card text generator."},
-        {"role": "user", "content": prompt}
-    ]
-    )
-    
-    logging.info("Full Response:")
-    logging.info(completion)
+    logging.info(messages[1]["content"])
 
-    return completion.choices[0].message.content
+    return messages, template.name
 
 
 # name = "Zahra"
@@ -165,23 +364,10 @@ def gpt_res(name, relationship, occasion, birthday, gender, random_traits, rando
 # print(extract_messages(greeting_message))
 
 
-def message_generator(name, relationship, occasion, birthday, gender, character_traits, message_theme):
+def validate_generation_inputs(name, relationship, occasion, birthday, gender, character_traits, message_theme):
     """
-    Generates a greeting card message based on given parameters.
-
-    Args:
-    name (str): Name of the person.
-    relationship (str): The relationship with the person.
-    occasion (str): The occasion for the message.
-    birthday (str): The birthday of the person.
-    gender (str): The gender of the person.
-    character_traits (list): A list of character traits.
-    message_theme (list): A list of message themes.
-
-    Returns:
-    tuple: A tuple containing generated messages or an error message.
+    Validates the fields of a generation request, raising ValueError on the first invalid one.
     """
-    # Validate inputs
     if not (isinstance(character_traits, list) and len(character_traits) >= 3):
         raise ValueError("character_traits must be a list of at least 3 items.")
     if not (isinstance(message_theme, list) and len(message_theme) >= 1):
@@ -193,46 +379,294 @@ def message_generator(name, relationship, occasion, birthday, gender, character_
     # Validate birthday format
     try:
         datetime.strptime(birthday, '%Y-%m-%d')
-    except ValueError:
+    except (TypeError, ValueError):
         raise ValueError("birthday must be a string in 'YYYY-MM-DD' format.")
 
-    try:
-        logging.info("Generating greeting card message...")
 
+def select_traits_and_themes(occasion_info, character_traits, message_theme, rng):
+    """
+    Picks the four traits and four themes of the prompt, favouring traits that matter for the occasion.
+
+    Returns:
+    tuple: (traits, themes) lists.
+    """
+    important_traits = occasion_info['important_traits']
+    logging.info(f"Important traits: {important_traits}")
+
+    selected_imp_traits = [trait for trait in character_traits if normalize_key(trait) in occasion_info['trait_keys']]
+    logging.info(f"Selected important traits: {selected_imp_traits}")
 
-        important_traits = get_important_traits(occasion)
-        logging.info(f"Important traits: {important_traits}")
+    selected_non_imp_traits = [trait for trait in character_traits if normalize_key(trait) not in occasion_info['trait_keys']]
+    logging.info(f"Selected non-important traits: {selected_non_imp_traits}")
 
-        selected_imp_traits = [trait for trait in character_traits if trait in important_traits]
-        logging.info(f"Selected important traits: {selected_imp_traits}")
+    random_trait = select_random_traits(selected_imp_traits, character_traits, rng=rng)
+    logging.info(f"Randomly selected traits: {random_trait}")
 
-        selected_non_imp_traits = [trait for trait in character_traits if trait not in important_traits]
-        logging.info(f"Selected non-important traits: {selected_non_imp_traits}")
+    random_theme = select_random_themes(message_theme, rng=rng)
+    logging.info(f"Randomly selected themes: {random_theme}")
 
+    return random_trait, random_theme
 
-        # random_trait = select_random_traits(character_traits)
-        random_trait = select_random_traits(selected_imp_traits, character_traits)
-        logging.info(f"Randomly selected traits: {random_trait}")
 
-        random_theme = select_random_themes(message_theme)
-        logging.info(f"Randomly selected themes: {random_theme}")   
+def message_generator(name, relationship, occasion, birthday, gender, character_traits, message_theme, seed=None,
+                      styles=None, length_budget=None):
+    """
+    Synchronous wrapper around message_generator_async, run on the shared background event loop.
+    """
+    return run_sync(message_generator_async(name, relationship, occasion, birthday, gender, character_traits, message_theme, seed,
+                                            styles, length_budget))
 
-        response = gpt_res(name, relationship, occasion, birthday, gender, random_trait, random_theme)
-        logging.info(f"Response: {response}")
 
-        try:
-            logging.info("Extracting messages...")
-            extracted_messages = extract_messages(response)
-            logging.info(f"Extracted messages: {extracted_messages}")
-            return extracted_messages[0], extracted_messages[1], extracted_messages[2], extracted_messages[3]
-        except Exception as extract_error:
-            logging.error(f"Error extracting messages: {extract_error}")
-            logging.info("Retrying...")
-            # Handle error in extract_messages and retry gpt_res call
-            response = gpt_res(name, relationship, occasion, birthday, gender, random_trait, random_theme)
-            extracted_messages = extract_messages(response)
-            return extracted_messages[0], extracted_messages[1], extracted_messages[2], extracted_messages[3]
+async def message_generator_async(name, relationship, occasion, birthday, gender, character_traits, message_theme, seed=None,
+                                  styles=None, length_budget=None):
+    """
+    Generates a greeting card message based on given parameters.
+
+    Args:
+    name (str): Name of the person.
+    relationship (str): The relationship with the person.
+    occasion (str): The occasion for the message.
+    birthday (str): The birthday of the person.
+    gender (str): The gender of the person.
+    character_traits (list): A list of character traits.
+    message_theme (list): A list of message themes.
+    seed (int): Seed for the trait, theme and prompt choices. The same request and seed give the
+        same prompt and, with the message cache enabled, the cached result. Pass a new seed to get
+        a new variant. Defaults to 0 when the cache is enabled and to a random seed otherwise.
+    styles (list): Styles to generate, any of MESSAGE_STYLES. Defaults to all four. Only the requested
+        sections are put in the prompt, and the messages of the other styles are returned empty.
+    length_budget (dict): Optional style -> maximum words. The prompt and max_tokens follow the budget.
+
+    Calls with the same normalized request that arrive while an identical one is being
+    generated wait for it and return its messages instead of calling the LLM again.
+
+    Returns:
+    tuple: A tuple containing generated messages or an error message. While the LLM circuit
+        breaker is open, the messages come from the offline template generator and the tuple
+        is a FallbackMessages, whose fallback attribute is True.
+    """
+    validate_generation_inputs(name, relationship, occasion, birthday, gender, character_traits, message_theme)
+    styles = normalize_styles(styles)
+    resolve_length_budget(styles, length_budget)
+
+    try:
+        logging.info("Generating greeting card message...")
+
+
+        # Caches and accounting use the canonical occasion; the prompt keeps the customer's own text
+        occasion_info = lookup_occasion(occasion)
+        occasion_name = occasion_info['name']
+        logging.info(f"Canonical occasion: {occasion_name}")
+
+        # Near-duplicate reuse and pooled variants only apply when the caller did not ask for a specific variant
+        seed_given = seed is not None
+
+        if seed is None and MESSAGE_CACHE_ENABLED:
+            seed = 0
+        rng = random.Random(seed)
+
+        # Sort the inputs so the seed maps to the same selection regardless of input order
+        character_traits = sorted(character_traits, key=normalize_key)
+        message_theme = sorted(message_theme, key=normalize_key)
+        age_years, _ = calculate_age(birthday, datetime.now().date())
+
+        cache_key = None
+        if MESSAGE_CACHE_ENABLED:
+            cache_key = build_message_key(name, relationship, occasion_name, age_years, gender, character_traits, message_theme, seed,
+                                          styles, length_budget)
+            cached = message_cache.get(cache_key)
+            if cached is not None:
+                logging.info(f"Message cache hit for seed {seed}")
+                return cached
+
+        # Stored full sets also serve style subsets, as long as no custom length was asked for
+        if SEMANTIC_CACHE_ENABLED and not seed_given and not length_budget:
+            match = semantic_cache.lookup(occasion_name, relationship, gender, character_traits, message_theme, age_years)
+            if match is not None:
+                (cached, cached_name, cached_age), similarity = match
+                logging.info(f"Semantic cache hit with similarity {similarity:.3f}")
+                return keep_styles(personalize_messages(cached, cached_name, name, cached_age, age_years), styles)
+
+        if VARIANT_POOL_ENABLED and not seed_given and not length_budget:
+            # The prompt never carries the recipient's name, so pooled sets fit any name as they are
+            pooled = variant_pool.pop(occasion_name, relationship, gender)
+            if pooled is not None:
+                logging.info(f"Serving pre-generated variant for {occasion_name} / {relationship}")
+                return keep_styles(pooled, styles)
+
+        async def generate():
+            random_trait, random_theme = select_traits_and_themes(occasion_info, character_traits, message_theme, rng)
+
+            # Every LLM call of this request, including the spirit lookup and retries, shares one time budget
+            with llm_deadline():
+                messages, template = await build_gpt_messages(name, relationship, occasion, birthday, gender, random_trait, random_theme,
+                                                              rng, styles, length_budget)
+                usage = {"purpose": "messages", "occasion": occasion_name, "template": template}
+                start = time.monotonic()
+                response = await request_gpt_messages(messages, styles, length_budget, usage)
+                logging.info(f"Response: {response}")
+                with structured_stats_lock:
+                    structured_stats["completion_seconds"] += time.monotonic() - start
+
+                logging.info("Extracting messages...")
+                extracted_messages = await parse_messages_response(messages, response, styles, length_budget, usage)
+                logging.info(f"Extracted messages: {extracted_messages}")
+
+            result = keep_styles(extracted_messages, styles)
+            if any(result):
+                if cache_key is not None:
+                    message_cache.set(cache_key, result)
+                # A set whose name is also an ordinary word in it cannot be reused for other names
+                if SEMANTIC_CACHE_ENABLED and styles == MESSAGE_STYLES and not length_budget \
+                        and name_is_personalizable(result, name):
+                    semantic_cache.add(occasion_name, relationship, gender, character_traits, message_theme, age_years,
+                                       (result, name, age_years))
+            return result
+
+        if not GENERATION_COALESCING_ENABLED:
+            return await generate()
+        # Identical requests in flight share one generation. A request without a seed may share
+        # the result of any other seedless one, so its key leaves the random seed out.
+        flight_key = build_message_key(name, relationship, occasion_name, age_years, gender, character_traits, message_theme,
+                                       seed if seed_given else None, styles, length_budget)
+        return await generation_flight.do(flight_key, generate)
+
+    except CircuitOpenError:
+        logging.warning("LLM circuit is open, serving template fallback messages")
+        fallback = generate_fallback_messages(name, occasion, character_traits, message_theme, random.Random(seed))
+        return FallbackMessages(keep_styles(fallback, styles))
         
     except Exception as e:
         logging.error(f"An error occurred during message generation: {e}", exc_info=True)
-        return f"An error occurred: {e}"
\ No newline at end of file
+        return f"An error occurred: {e}"
+
+
+def generate_messages_batch(recipients, concurrency=None):
+    """
+    Synchronous wrapper around generate_messages_batch_async.
+    """
+    return run_sync(generate_messages_batch_async(recipients, concurrency))
+
+
+async def generate_messages_batch_async(recipients, concurrency=None):
+    """
+    Generates messages for many recipients concurrently.
+
+    Spirit lookups for the distinct occasions in the batch are resolved once up front,
+    then the recipients are fanned out over the shared client with at most `concurrency`
+    generations in flight.
+
+    Args:
+    recipients (list): Recipient specs, each a dict with the fields message_generator takes, and
+        optionally seed, styles and length_budget.
+    concurrency (int): Maximum generations in flight. Defaults to, and is capped at, [BATCH] concurrency.
+
+    Returns:
+    list: One dict per recipient in input order, holding either the requested message styles or an 'error'.
+    """
+    if not isinstance(recipients, list) or not recipients:
+        raise ValueError("recipients must be a non-empty list.")
+    if len(recipients) > BATCH_MAX_RECIPIENTS:
+        raise ValueError(f"recipients must not contain more than {BATCH_MAX_RECIPIENTS} items.")
+
+    concurrency = min(concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY)
+    semaphore = asyncio.Semaphore(concurrency)
+    logging.info(f"Generating messages for {len(recipients)} recipients, concurrency {concurrency}")
+
+    # Resolve each distinct occasion once so recipients sharing it all hit the spirit cache
+    occasions = {lookup_occasion(spec['occasion'])['name'] for spec in recipients
+                 if isinstance(spec, dict) and isinstance(spec.get('occasion'), str) and spec['occasion']}
+    spirits = await asyncio.gather(*(get_core_of_the_event_async(o) for o in occasions), return_exceptions=True)
+    for occasion, spirit in zip(occasions, spirits):
+        if isinstance(spirit, Exception):
+            logging.error(f"Spirit lookup failed for '{occasion}': {spirit}")
+
+    async def generate_one(spec):
+        if not isinstance(spec, dict):
+            return {'error': "Each recipient must be an object."}
+        async with semaphore:
+            try:
+                styles = normalize_styles(spec.get('styles'))
+                result = await message_generator_async(*(spec.get(field) for field in RECIPIENT_FIELDS), seed=spec.get('seed'),
+                                                       styles=styles, length_budget=spec.get('length_budget'))
+            except Exception as e:
+                return {'error': str(e)}
+        if isinstance(result, str):
+            return {'error': result}
+        messages = {style: message for style, message in zip(MESSAGE_STYLES, result) if style in styles}
+        if getattr(result, 'fallback', False):
+            messages['fallback'] = True
+        return messages
+
+    return await asyncio.gather(*(generate_one(spec) for spec in recipients))
+
+
+async def message_generator_stream_async(name, relationship, occasion, birthday, gender, character_traits, message_theme, seed=None):
+    """
+    Streaming variant of message_generator_async.
+
+    Calls the completion API with streaming enabled and yields each message style as soon
+    as its JSON object is complete in the token stream, instead of waiting for all four.
+
+    Args:
+    Same as message_generator_async.
+
+    Yields:
+    tuple: (style, message) pairs, where style is one of MESSAGE_STYLES. While the LLM circuit
+    is open the messages are template fallbacks, each a FallbackMessage.
+    """
+    validate_generation_inputs(name, relationship, occasion, birthday, gender, character_traits, message_theme)
+
+    occasion_info = lookup_occasion(occasion)
+    occasion_name = occasion_info['name']
+
+    if seed is None and MESSAGE_CACHE_ENABLED:
+        seed = 0
+    rng = random.Random(seed)
+
+    character_traits = sorted(character_traits, key=normalize_key)
+    message_theme = sorted(message_theme, key=normalize_key)
+
+    cache_key = None
+    if MESSAGE_CACHE_ENABLED:
+        age_years, _ = calculate_age(birthday, datetime.now().date())
+        cache_key = build_message_key(name, relationship, occasion_name, age_years, gender, character_traits, message_theme, seed)
+        cached = message_cache.get(cache_key)
+        if cached is not None:
+            logging.info(f"Message cache hit for seed {seed}")
+            for style, message in zip(MESSAGE_STYLES, cached):
+                yield style, message
+            return
+
+    random_trait, random_theme = select_traits_and_themes(occasion_info, character_traits, message_theme, rng)
+
+    # The deadline covers the spirit lookup and the start of the stream
+    try:
+        with llm_deadline():
+            messages, template = await build_gpt_messages(name, relationship, occasion, birthday, gender, random_trait, random_theme, rng)
+
+            logging.info("Calling OpenAI API with streaming...")
+            parser = StreamingMessageParser()
+            usage = {"purpose": "messages_stream", "occasion": occasion_name, "template": template}
+            stream = await chat_completion_async(messages=messages, stream=True, usage=usage, **completion_kwargs())
+    except CircuitOpenError:
+        logging.warning("LLM circuit is open, streaming template fallback messages")
+        fallback = generate_fallback_messages(name, occasion, character_traits, message_theme, random.Random(seed))
+        for style, message in zip(MESSAGE_STYLES, fallback):
+            yield style, FallbackMessage(message)
+        return
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        text = chunk.choices[0].delta.content
+        if text:
+            for style, message in parser.feed(text):
+                yield style, message
+
+    for style, message in parser.finish():
+        yield style, message
+
+    logging.info(f"Streamed response: {parser.buffer}")
+    result = parser.messages()
+    if cache_key is not None and any(result):
+        message_cache.set(cache_key, result)
@@ -0,0 +1,129 @@
+from collections import deque
+import threading
+import logging
+import time
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised instead of calling the LLM while the circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker around the upstream LLM.
+
+    While closed, the outcome of every call is kept in a sliding window. When the window
+    holds at least min_calls outcomes and either the failure rate or the rate of calls
+    slower than slow_call_seconds reaches its threshold, the circuit opens and calls are
+    rejected for open_seconds. It then half-opens and lets a few probe calls through: a
+    fast success closes it again, anything else reopens it.
+    """
+
+    def __init__(self, window_size=20, min_calls=10, error_rate_threshold=0.5, slow_call_seconds=20.0,
+                 slow_call_rate_threshold=0.5, open_seconds=30.0, half_open_max_calls=1):
+        """
+        Args:
+        window_size (int): Number of most recent call outcomes considered.
+        min_calls (int): Outcomes needed in the window before the circuit can trip.
+        error_rate_threshold (float): Failure rate (0-1) that trips the circuit.
+        slow_call_seconds (float): Latency from which a call counts as slow.
+        slow_call_rate_threshold (float): Slow call rate (0-1) that trips the circuit.
+        open_seconds (float): Time calls are rejected before probing the upstream again.
+        half_open_max_calls (int): Probe calls allowed at once while half-open.
+        """
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.state = "closed"
+        self._outcomes = deque(maxlen=window_size)
+        self._opened_at = None
+        self._half_open_calls = 0
+        self._lock = threading.Lock()
+        self.stats = {"opened": 0, "rejected": 0, "probes": 0}
+
+    def allow(self):
+        """
+        Returns True if a call may go to the upstream now. Every allowed call must be
+        followed by exactly one record().
+        """
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self.stats["rejected"] += 1
+                    return False
+                logging.info("LLM circuit half-open, probing the upstream")
+                self.state = "half_open"
+                self._half_open_calls = 0
+            if self.state == "half_open":
+                if self._half_open_calls >= self.half_open_max_calls:
+                    self.stats["rejected"] += 1
+                    return False
+                self._half_open_calls += 1
+                self.stats["probes"] += 1
+            return True
+
+    def is_open(self):
+        """
+        Returns True while the circuit is open and still rejecting every call.
+        """
+        with self._lock:
+            return self.state == "open" and time.monotonic() - self._opened_at < self.open_seconds
+
+    def record(self, success, latency=None):
+        """
+        Records the outcome of an allowed call.
+
+        Args:
+        success (bool): True if the call succeeded, False if it failed because of the
+            upstream, None if the outcome says nothing about its health (e.g. a bad request).
+        latency (float): Seconds the call took.
+        """
+        slow = latency is not None and latency >= self.slow_call_seconds
+        with self._lock:
+            if self.state == "half_open":
+                self._half_open_calls = max(self._half_open_calls - 1, 0)
+                if success is None:
+                    return
+                if success and not slow:
+                    logging.info("LLM circuit closed")
+                    self.state = "closed"
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            if self.state == "open" or success is None:
+                return
+
+            self._outcomes.append((not success, slow))
+            calls = len(self._outcomes)
+            if calls >= self.min_calls:
+                error_rate = sum(failed for failed, _ in self._outcomes) / calls
+                slow_rate = sum(slow for _, slow in self._outcomes) / calls
+                if error_rate >= self.error_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+                    logging.error(f"LLM circuit opened: error rate {error_rate:.2f}, slow call rate {slow_rate:.2f}")
+                    self._open()
+
+    def _open(self):
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.stats["opened"] += 1
+
+    def snapshot(self):
+        """
+        Returns the state, the counters and the failure and slow call rates of the current window.
+        """
+        with self._lock:
+            calls = len(self._outcomes)
+            return dict(
+                self.stats,
+                state=self.state,
+                window_calls=calls,
+                error_rate=sum(failed for failed, _ in self._outcomes) / calls if calls else 0.0,
+                slow_call_rate=sum(slow for _, slow in self._outcomes) / calls if calls else 0.0
+            )
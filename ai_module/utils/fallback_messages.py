@@ -0,0 +1,82 @@
+import random
+
+from ai_module.utils.occasions import lookup_occasion
+
+
+class FallbackMessages(tuple):
+    """
+    Message tuple produced by the offline template generator instead of the LLM.
+    """
+    fallback = True
+
+
+class FallbackMessage(str):
+    """
+    One streamed message produced by the offline template generator instead of the LLM.
+    """
+    fallback = True
+
+
+# Templates of each style. Placeholders: {name}, {greeting}, {trait}, {theme}, {keyword} and
+# {keyword2} (from the occasion's keywords). The occasion itself only appears through its
+# greeting, so the templates read well with any occasion name.
+FALLBACK_TEMPLATES = {
+    "Normal1Paragraph": [
+        "{greeting}, {name}! Your {trait} heart makes every day brighter, and today I hope you feel "
+        "all the {keyword} and {keyword2} you give to everyone around you.",
+        "Dear {name}, {greeting}! Wishing you a day full of {keyword} and {keyword2}, and a year as "
+        "{trait} and wonderful as you are.",
+        "{greeting}, {name}! Here's to {keyword}, {keyword2} and all the {theme} moments that make this "
+        "day special, just like your {trait} spirit.",
+    ],
+    "Normal2Paragraphs": [
+        "{greeting}, {name}! Today is a reminder of how much {keyword} you bring into our lives."
+        "\n\nThank you for being so {trait}. May the days ahead be filled with {keyword2} and {theme} moments.",
+        "Dear {name}, there is no better time to celebrate {keyword} and {keyword2}."
+        "\n\nYour {trait} nature makes every celebration better. {greeting}!",
+    ],
+    "ShortAndSweet": [
+        "{greeting}, {name}! Wishing you {keyword} and {keyword2}.",
+        "{greeting}! Stay {trait}, {name}.",
+        "To {name}: {keyword}, {keyword2} and a wonderful day!",
+    ],
+    "Poem": [
+        "{greeting}, {name}, my dear\nMay {keyword} and {keyword2} be near\nYour {trait} heart shines bright\n"
+        "And fills this day with light",
+        "This day arrives with {keyword}\nA {theme} wish sent your way\nFor someone {trait} and true\n"
+        "{greeting}, {name}, to you",
+    ],
+}
+
+
+def generate_fallback_messages(name, occasion, character_traits, message_theme, rng=None):
+    """
+    Generates the four message styles from local templates, without any LLM call.
+
+    The messages use the occasion's greeting and keywords from the occasion registry, and
+    one of the recipient's traits and themes per style.
+
+    Args:
+    name (str): Name of the person.
+    occasion (str): The occasion for the message.
+    character_traits (list): A list of character traits.
+    message_theme (list): A list of message themes.
+    rng (random.Random): Optional generator, so a seed reproduces the same messages.
+
+    Returns:
+    FallbackMessages: The four messages in message_generator order.
+    """
+    rng = rng or random
+    occasion_info = lookup_occasion(occasion)
+    messages = []
+    for style, templates in FALLBACK_TEMPLATES.items():
+        keyword, keyword2 = rng.sample(occasion_info['keywords'], 2)
+        messages.append(rng.choice(templates).format(
+            name=name,
+            greeting=occasion_info['greeting'],
+            trait=rng.choice(character_traits).lower(),
+            theme=rng.choice(message_theme).lower(),
+            keyword=keyword,
+            keyword2=keyword2
+        ))
+    return FallbackMessages(messages)
@@ -0,0 +1,78 @@
+from collections import OrderedDict
+from io import BytesIO
+from PIL import ImageFont
+import threading
+
+
+class FontRegistry:
+    """
+    Process-wide registry of TrueType fonts.
+
+    Each font file is read from disk once and kept in memory. Sized faces are built from
+    those bytes on first use and kept in an LRU keyed by (path, size), so repeated renders
+    at the same sizes do no font I/O and construct no new FreeType faces.
+    """
+
+    def __init__(self, max_faces=128):
+        """
+        Args:
+        max_faces (int): Maximum number of sized faces kept before the least recently used is evicted.
+        """
+        self.max_faces = max_faces
+        self._files = {}
+        self._faces = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"file_loads": 0, "face_hits": 0, "face_misses": 0, "evictions": 0, "load_errors": 0}
+
+    def _font_bytes(self, path):
+        data = self._files.get(path)
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+            self._files[path] = data
+            self.stats["file_loads"] += 1
+        return data
+
+    def get(self, path, size):
+        """
+        Returns the face of a font file at a size.
+
+        Raises:
+        OSError: If the font file cannot be read or is not a valid font.
+        """
+        key = (path, size)
+        with self._lock:
+            face = self._faces.get(key)
+            if face is not None:
+                self._faces.move_to_end(key)
+                self.stats["face_hits"] += 1
+                return face
+            try:
+                face = ImageFont.truetype(BytesIO(self._font_bytes(path)), size)
+            except OSError:
+                self.stats["load_errors"] += 1
+                raise
+            self.stats["face_misses"] += 1
+            self._faces[key] = face
+            while len(self._faces) > self.max_faces:
+                self._faces.popitem(last=False)
+                self.stats["evictions"] += 1
+            return face
+
+    def font_bytes(self, path):
+        """
+        Returns the cached content of a font file, reading it on first use.
+        """
+        with self._lock:
+            return self._font_bytes(path)
+
+    def snapshot(self):
+        """
+        Returns the counters together with the number of loaded files and cached faces.
+        """
+        with self._lock:
+            return dict(self.stats, files=len(self._files), faces=len(self._faces))
+
+
+# Shared by every renderer in the process
+font_registry = FontRegistry()
@@ -0,0 +1,243 @@
+from array import array
+from io import BytesIO
+from PIL import ImageFont
+import threading
+import hashlib
+import logging
+import pickle
+import random
+import zlib
+import sys
+import os
+
+from ai_module.utils.font_registry import font_registry
+
+
+# Size the reference advances are measured at; large enough that their rounding is negligible
+REFERENCE_SIZE = 2048
+
+# Pixel sizes the hinted advances are tabulated for, covering the letter renderer's size search
+MIN_TABLE_SIZE = 1
+MAX_TABLE_SIZE = 1000
+
+# Codepoints in the table: printable ASCII and Latin-1, typographic quotes and dashes, ellipsis, bullet, euro
+TABLE_CODEPOINTS = (list(range(0x20, 0x7F)) + list(range(0xA0, 0x100))
+                    + [0x2013, 0x2014, 0x2018, 0x2019, 0x201C, 0x201D, 0x2022, 0x2026, 0x20AC])
+
+# Characters whose pairs are checked for kerning when building a table
+KERNING_CHARACTERS = [chr(c) for c in range(0x20, 0x7F)]
+
+TABLE_VERSION = 1
+
+
+def metrics_path(font_path):
+    """
+    Returns the path of a font's metrics table, next to the font file.
+    """
+    return f"{os.path.splitext(font_path)[0]}.metrics.pkl"
+
+
+def font_digest(font_path):
+    """
+    Returns the SHA-1 of a font file, so a table built from another version of the font is not used.
+    """
+    return hashlib.sha1(font_registry.font_bytes(font_path)).hexdigest()
+
+
+class GlyphMetrics:
+    """
+    Advance-width table of one font, measuring text without FreeType.
+
+    Pillow's basic layout advances the pen by each glyph's hinted advance plus kerning, so
+    the width of a line is a sum of per-glyph values. The table holds the advance of every
+    glyph at REFERENCE_SIZE, which scales linearly, and, for every pixel size from
+    MIN_TABLE_SIZE to MAX_TABLE_SIZE, the small correction hinting applies to the scaled
+    and rounded advance. Sizes outside that range use the linear estimate alone.
+    Characters not in the table are measured with FreeType once per size.
+    """
+
+    def __init__(self, font_path, digest, codepoints, reference_advances, corrections, kerning=None,
+                 min_size=MIN_TABLE_SIZE, max_size=MAX_TABLE_SIZE):
+        """
+        Args:
+        font_path (str): The font file.
+        digest (str): SHA-1 of the font file the table was built from.
+        codepoints (array): Codepoints of the table columns.
+        reference_advances (array): Advance of each codepoint at REFERENCE_SIZE, in pixels.
+        corrections (array): Signed bytes, one row of len(codepoints) per size from min_size to max_size:
+            the hinted advance minus the rounded linear one.
+        kerning (dict): Optional (left, right) character pair -> kerning at REFERENCE_SIZE, in pixels.
+        """
+        self.font_path = font_path
+        self.digest = digest
+        self.codepoints = codepoints
+        self.reference_advances = reference_advances
+        self.corrections = corrections
+        self.kerning = kerning or {}
+        self.min_size = min_size
+        self.max_size = max_size
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def advances(self, size):
+        """
+        Returns the character -> advance dict of a pixel size, built from the table on first use.
+        """
+        row = self._rows.get(size)
+        if row is None:
+            scale = size / REFERENCE_SIZE
+            values = [round(advance * scale) for advance in self.reference_advances]
+            if self.min_size <= size <= self.max_size:
+                start = (size - self.min_size) * len(self.codepoints)
+                values = [value + correction for value, correction in
+                          zip(values, self.corrections[start:start + len(self.codepoints)])]
+            row = dict(zip(map(chr, self.codepoints), values))
+            with self._lock:
+                self._rows[size] = row
+        return row
+
+    def text_width(self, text, size):
+        """
+        Returns the width of a single line of text at a pixel size, as ImageDraw.textlength measures it.
+        """
+        row = self.advances(size)
+        try:
+            width = sum(map(row.__getitem__, text))
+        except KeyError:
+            width = 0
+            for char in text:
+                advance = row.get(char)
+                if advance is None:
+                    advance = row[char] = font_registry.get(self.font_path, size).getlength(char)
+                width += advance
+        if self.kerning:
+            scale = size / REFERENCE_SIZE
+            width += sum(round(self.kerning.get(pair, 0) * scale) for pair in zip(text, text[1:]))
+        return width
+
+    def kerning_between(self, left, right, size):
+        """
+        Returns the kerning between two characters at a pixel size, as text_width adds it.
+        """
+        if not self.kerning:
+            return 0
+        return round(self.kerning.get((left, right), 0) * (size / REFERENCE_SIZE))
+
+    def save(self, path=None):
+        """
+        Writes the table to a compact pickle, the hinting corrections zlib-compressed.
+        """
+        path = path or metrics_path(self.font_path)
+        data = {
+            "version": TABLE_VERSION,
+            "font": os.path.basename(self.font_path),
+            "digest": self.digest,
+            "reference_size": REFERENCE_SIZE,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "codepoints": self.codepoints,
+            "reference_advances": self.reference_advances,
+            "corrections": zlib.compress(self.corrections.tobytes(), 9),
+            "kerning": self.kerning
+        }
+        with open(path, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return path
+
+    @classmethod
+    def load(cls, font_path, path=None):
+        """
+        Loads the table of a font.
+
+        Raises:
+        ValueError: If the table has another format version or was built from a different font file.
+        """
+        with open(path or metrics_path(font_path), "rb") as f:
+            data = pickle.load(f)
+        if data.get("version") != TABLE_VERSION or data.get("reference_size") != REFERENCE_SIZE:
+            raise ValueError("The glyph metrics table has an unsupported format.")
+        if data["digest"] != font_digest(font_path):
+            raise ValueError("The glyph metrics table was built from a different version of the font.")
+        corrections = array("b")
+        corrections.frombytes(zlib.decompress(data["corrections"]))
+        return cls(font_path, data["digest"], data["codepoints"], data["reference_advances"], corrections,
+                   data["kerning"], data["min_size"], data["max_size"])
+
+
+def build_glyph_metrics(font_path, min_size=MIN_TABLE_SIZE, max_size=MAX_TABLE_SIZE, codepoints=TABLE_CODEPOINTS):
+    """
+    Measures a font with FreeType and returns its GlyphMetrics table.
+    """
+    characters = [chr(c) for c in codepoints]
+    data = font_registry.font_bytes(font_path)
+    # Faces are built directly so the build does not churn the registry's LRU
+    reference = ImageFont.truetype(BytesIO(data), REFERENCE_SIZE)
+    reference_advances = array("f", (reference.getlength(char) for char in characters))
+
+    kerning = {}
+    for left in KERNING_CHARACTERS:
+        for right in KERNING_CHARACTERS:
+            value = reference.getlength(left + right) - reference.getlength(left) - reference.getlength(right)
+            if value:
+                kerning[(left, right)] = value
+
+    corrections = array("b")
+    for size in range(min_size, max_size + 1):
+        font = ImageFont.truetype(BytesIO(data), size)
+        scale = size / REFERENCE_SIZE
+        corrections.extend(int(font.getlength(char)) - round(advance * scale)
+                           for char, advance in zip(characters, reference_advances))
+    return GlyphMetrics(font_path, font_digest(font_path), array("I", codepoints), reference_advances, corrections,
+                        kerning, min_size, max_size)
+
+
+def verify_glyph_metrics(metrics, samples=200, sizes=None, seed=0):
+    """
+    Compares the table with ImageDraw.textlength on random lines of table characters.
+
+    Returns:
+    float: The largest difference found, in pixels.
+    """
+    rng = random.Random(seed)
+    characters = [chr(c) for c in metrics.codepoints]
+    words = ["".join(rng.choice(characters) for _ in range(rng.randint(1, 10))) for _ in range(200)]
+    sizes = sizes or [rng.randint(metrics.min_size, metrics.max_size) for _ in range(20)]
+    worst = 0.0
+    for size in sizes:
+        font = font_registry.get(metrics.font_path, size)
+        for _ in range(samples // len(sizes) or 1):
+            line = " ".join(rng.choice(words) for _ in range(rng.randint(1, 12)))
+            worst = max(worst, abs(metrics.text_width(line, size) - font.getlength(line)))
+    return worst
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def get_glyph_metrics(font_path):
+    """
+    Returns the metrics table of a font, loaded once per process, or None if the font has no
+    up-to-date table (build one with `python -m ai_module.utils.glyph_metrics <font>`).
+    """
+    with _tables_lock:
+        if font_path not in _tables:
+            try:
+                _tables[font_path] = GlyphMetrics.load(font_path)
+            except (OSError, ValueError, pickle.UnpicklingError, KeyError) as e:
+                logging.warning(f"No usable glyph metrics for '{font_path}', measuring with FreeType: {e}")
+                _tables[font_path] = None
+        return _tables[font_path]
+
+
+if __name__ == "__main__":
+    # Builds and checks the table of each font given on the command line
+    failed = False
+    for path in sys.argv[1:]:
+        table = build_glyph_metrics(path)
+        written = table.save()
+        deviation = verify_glyph_metrics(table)
+        print(f"{written}: {len(table.codepoints)} glyphs, {len(table.kerning)} kerning pairs, "
+              f"max deviation from textlength {deviation:.2f}px")
+        failed = failed or deviation > 1
+    sys.exit(1 if failed else 0)
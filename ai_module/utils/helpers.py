@@ -1,4 +1,28 @@
 from datetime import datetime
+import configparser
+import json
+import os
+
+
+def load_config():
+    """
+    Loads and returns the configuration from the config.ini file in the project root directory.
+    """
+    # Get the directory of the current script
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+
+    # Go up two levels to the project root
+    project_root = os.path.dirname(os.path.dirname(script_dir))
+
+    # Construct the path to the config.ini file
+    config_file_path = os.path.join(project_root, 'config.ini')
+
+    # Initialize and read the config parser
+    config = configparser.ConfigParser()
+    config.read(config_file_path)
+
+    return config
+
 
 def calculate_age(dob_str, today_date):
     """
@@ -19,4 +43,18 @@ def calculate_age(dob_str, today_date):
     age_in_years = today_date.year - dob.year - ((today_date.month, today_date.day) < (dob.month, dob.day))
     age_in_days = (today_date - dob).days
 
-    return age_in_years, age_in_days
\ No newline at end of file
+    return age_in_years, age_in_days
+
+
+def sse_event(event, data):
+    """
+    Formats one Server-Sent Events message with a JSON payload.
+
+    Args:
+    event (str): Event name.
+    data (dict): Payload, serialized as JSON.
+
+    Returns:
+    str: The SSE message, terminated by a blank line.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
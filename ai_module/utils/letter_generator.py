@@ -1,8 +1,9 @@
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 import os
 import requests
 from io import BytesIO
 
+from ai_module.utils.letter_layout import layout_letter, render_layout_image
 from ai_module.utils.log_config import setup_logging
 import logging
 
@@ -23,136 +24,11 @@ def create_base_image(width_mm=127, height_mm=177.8, dpi=300):
     logging.info(f"Creating base image: {width_px}x{height_px} pixels ({width_mm}mm x {height_mm}mm)")
     return Image.new('RGB', (width_px, height_px), color='white')
 
-# Font handling
-def get_font(font_name="wilson-p4chbsdco3fw3f363hr4acd9fr (1).ttf", size=100):
-    """Load a font with specified size and fallback to default"""
-    try:
-        font = ImageFont.truetype(font_name, size)
-        return font
-    except Exception as e:
-        logging.error(f"Failed to load font '{font_name}': {e}. Using default font")
-        return ImageFont.load_default()
-
-# Text drawing with optimized sizing and poem handling
+# Text drawing, laid out by the shared letter layout
 def draw_letter_content(image, greeting, body, signoff, start_x=0):
-    """Draw letter content with 15% margins, sign-off right-aligned with newlines, in (23, 89, 141) color"""
-    draw = ImageDraw.Draw(image)
-    margin_percent = 0.15  # 15% margin
-    min_font_size = 10
-    max_font_size = 1000
-    line_spacing_factor = 1.4
-    text_color = (23, 89, 141)  # RGB color
-    
-    # Calculate margins in pixels relative to the right half
-    width_margin = int(image.width * margin_percent / 2)  # Half the total width for right side
-    height_margin = int(image.height * margin_percent)
-    max_width = (image.width // 2) - (2 * width_margin)  # Right half minus margins
-    usable_height = image.height - (2 * height_margin)
-    logging.info(f"Width margin: {width_margin}px, Height margin: {height_margin}px")
-    logging.info(f"Max text width: {max_width}px, Usable height: {usable_height}px")
-    
-    # Check if body is a poem (more than 2 newlines)
-    new_line_count = body.count('\n')
-    is_poem = new_line_count > 2
-    logging.info(f"Body has {new_line_count} newlines. Is poem: {is_poem}")
-    
-    # Helper function to get text metrics
-    def get_text_metrics(text, font, max_width, is_poem=False, right_align=False):
-        if is_poem or right_align:
-            lines = [line.strip() for line in text.split('\n') if line.strip()]
-        else:
-            lines = []
-            words = text.split()
-            current_line = []
-            for word in words:
-                test_line = ' '.join(current_line + [word])
-                if draw.textlength(test_line, font=font) <= max_width:
-                    current_line.append(word)
-                else:
-                    if current_line:
-                        lines.append(' '.join(current_line))
-                    current_line = [word]
-            if current_line:
-                lines.append(' '.join(current_line))
-        
-        max_line_width = max((draw.textlength(line, font=font) for line in lines), default=0)
-        fits_width = max_line_width <= max_width
-        
-        if is_poem:
-            positions = [(max_width - draw.textlength(line, font=font)) / 2 + start_x + width_margin if line else start_x + width_margin 
-                        for line in lines]
-            return lines, len(lines), positions, fits_width
-        elif right_align:
-            positions = [max_width - draw.textlength(line, font=font) + start_x + width_margin if line else start_x + width_margin 
-                        for line in lines]
-            return lines, len(lines), positions, fits_width
-        return lines, len(lines), [start_x + width_margin] * len(lines), fits_width  # Left-aligned with margin
-
-    # Binary search for optimal font size
-    def find_optimal_font_size(greeting, body, signoff, min_size, max_size):
-        left, right = min_size, max_size
-        optimal_size = min_size
-        
-        while left <= right:
-            mid = (left + right) // 2
-            font = get_font("wilson-p4chbsdco3fw3f363hr4acd9fr (1).ttf", mid)
-            line_spacing = int(mid * line_spacing_factor)
-            
-            greeting_lines, greeting_count, _, _ = get_text_metrics(greeting, font, max_width)
-            body_lines, body_count, _, body_fits = get_text_metrics(body, font, max_width, is_poem)
-            signoff_lines, signoff_count, _, _ = get_text_metrics(signoff, font, max_width, right_align=True)
-            
-            total_lines = greeting_count + body_count + signoff_count + 2
-            total_height = total_lines * line_spacing
-            
-            logging.info(f"Testing font size {mid}: Total lines: {total_lines}, Height: {total_height}px, "
-                  f"Body fits width: {body_fits}")
-            
-            if total_height <= usable_height and body_fits:
-                optimal_size = mid
-                left = mid + 1
-            else:
-                right = mid - 1
-        
-        return optimal_size
-
-    # Find optimal font size
-    font_size = find_optimal_font_size(greeting, body, signoff, min_font_size, max_font_size)
-    font = get_font("wilson-p4chbsdco3fw3f363hr4acd9fr (1).ttf", font_size)
-    line_spacing = int(font_size * line_spacing_factor)
-    logging.info(f"Optimal font size selected: {font_size}")
-    
-    # Get final text metrics
-    greeting_lines, greeting_count, greeting_x_positions, _ = get_text_metrics(greeting, font, max_width)
-    body_lines, body_count, body_x_positions, _ = get_text_metrics(body, font, max_width, is_poem)
-    signoff_lines, signoff_count, signoff_x_positions, _ = get_text_metrics(signoff, font, max_width, right_align=True)
-    
-    # Calculate total content height and center it
-    total_lines = greeting_count + body_count + signoff_count + 2
-    total_height = total_lines * line_spacing
-    start_y = height_margin + (usable_height - total_height) // 2
-    logging.info(f"Total content height: {total_height}px, Starting y-position: {start_y}px")
-    
-    # Draw the text
-    y_pos = start_y
-    logging.info("Drawing greeting")
-    for i, line in enumerate(greeting_lines):
-        draw.text((greeting_x_positions[i], y_pos), line, font=font, fill=text_color)
-        y_pos += line_spacing
-    
-    y_pos += line_spacing  # Gap
-    logging.info("Drawing body" + (" (centered)" if is_poem else ""))
-    for i, line in enumerate(body_lines):
-        draw.text((body_x_positions[i], y_pos), line, font=font, fill=text_color)
-        y_pos += line_spacing
-    
-    y_pos += line_spacing  # Gap
-    logging.info("Drawing sign-off (right-aligned)")
-    for i, line in enumerate(signoff_lines):
-        draw.text((signoff_x_positions[i], y_pos), line, font=font, fill=text_color)
-        y_pos += line_spacing
-    
-    return image
+    """Draw letter content on the right half of the image with 15% margins, sign-off right-aligned, in (23, 89, 141) color"""
+    plan = layout_letter(greeting, body, signoff, image.width // 2, image.height, x_offset=start_x)
+    return render_layout_image(image, plan)
 
 def create_letter_png_with_blank_page(greeting, body, signoff, output_path="output-page-02.png", width_mm=127, height_mm=177.8, dpi=300):
     """Create a PNG letter with a blank page on the left and dotted line in between"""
@@ -251,125 +127,8 @@ def concatenate_images(local_path, url, output_path="concatenated-output-page-01
 
 def draw_letter_content_png(image, greeting, body, signoff):
     """Draw letter content with 15% margins, sign-off right-aligned with newlines, in (23, 89, 141) color"""
-    draw = ImageDraw.Draw(image)
-    margin_percent = 0.15  # 15% margin (corrected from 0.1 in your code to match request)
-    min_font_size = 10
-    max_font_size = 1000
-    line_spacing_factor = 1.4
-    text_color = (23, 89, 141)  # RGB color
-    
-    # Calculate margins in pixels
-    width_margin = int(image.width * margin_percent)
-    height_margin = int(image.height * margin_percent)
-    max_width = image.width - (2 * width_margin)
-    usable_height = image.height - (2 * height_margin)
-    logging.info(f"Width margin: {width_margin}px, Height margin: {height_margin}px")
-    logging.info(f"Max text width: {max_width}px, Usable height: {usable_height}px")
-    
-    # Check if body is a poem (more than 2 newlines)
-    new_line_count = body.count('\n')
-    is_poem = new_line_count > 2
-    logging.info(f"Body has {new_line_count} newlines. Is poem: {is_poem}")
-    
-    # Helper function to get text metrics
-    def get_text_metrics(text, font, max_width, is_poem=False, right_align=False):
-        if is_poem or right_align:
-            # Split by newlines for poems and sign-off to preserve line breaks
-            lines = [line.strip() for line in text.split('\n') if line.strip()]
-        else:
-            # Wrap text for non-poems
-            lines = []
-            words = text.split()
-            current_line = []
-            for word in words:
-                test_line = ' '.join(current_line + [word])
-                if draw.textlength(test_line, font=font) <= max_width:
-                    current_line.append(word)
-                else:
-                    if current_line:
-                        lines.append(' '.join(current_line))
-                    current_line = [word]
-            if current_line:
-                lines.append(' '.join(current_line))
-        
-        max_line_width = max((draw.textlength(line, font=font) for line in lines), default=0)
-        fits_width = max_line_width <= max_width
-        
-        if is_poem:
-            positions = [(max_width - draw.textlength(line, font=font)) / 2 + width_margin if line else width_margin 
-                        for line in lines]
-            return lines, len(lines), positions, fits_width
-        elif right_align:
-            positions = [max_width - draw.textlength(line, font=font) + width_margin if line else width_margin 
-                        for line in lines]
-            return lines, len(lines), positions, fits_width
-        return lines, len(lines), [width_margin] * len(lines), fits_width  # Left-aligned with margin
-
-    # Binary search for optimal font size
-    def find_optimal_font_size(greeting, body, signoff, min_size, max_size):
-        left, right = min_size, max_size
-        optimal_size = min_size
-        
-        while left <= right:
-            mid = (left + right) // 2
-            font = get_font("wilson-p4chbsdco3fw3f363hr4acd9fr (1).ttf", mid)
-            line_spacing = int(mid * line_spacing_factor)
-            
-            greeting_lines, greeting_count, _, _ = get_text_metrics(greeting, font, max_width)
-            body_lines, body_count, _, body_fits = get_text_metrics(body, font, max_width, is_poem)
-            signoff_lines, signoff_count, _, _ = get_text_metrics(signoff, font, max_width, right_align=True)
-            
-            total_lines = greeting_count + body_count + signoff_count + 2
-            total_height = total_lines * line_spacing
-            
-            logging.info(f"Testing font size {mid}: Total lines: {total_lines}, Height: {total_height}px, "
-                  f"Body fits width: {body_fits}")
-            
-            if total_height <= usable_height and body_fits:
-                optimal_size = mid
-                left = mid + 1
-            else:
-                right = mid - 1
-        
-        return optimal_size
-    
-    # Find optimal font size
-    font_size = find_optimal_font_size(greeting, body, signoff, min_font_size, max_font_size)
-    font = get_font("wilson-p4chbsdco3fw3f363hr4acd9fr (1).ttf", font_size)
-    line_spacing = int(font_size * line_spacing_factor)
-    logging.info(f"Optimal font size selected: {font_size}")
-    
-    # Get final text metrics
-    greeting_lines, greeting_count, greeting_x_positions, _ = get_text_metrics(greeting, font, max_width)
-    body_lines, body_count, body_x_positions, _ = get_text_metrics(body, font, max_width, is_poem)
-    signoff_lines, signoff_count, signoff_x_positions, _ = get_text_metrics(signoff, font, max_width, right_align=True)
-    
-    # Calculate total content height and center it
-    total_lines = greeting_count + body_count + signoff_count + 2
-    total_height = total_lines * line_spacing
-    start_y = height_margin + (usable_height - total_height) // 2
-    logging.info(f"Total content height: {total_height}px, Starting y-position: {start_y}px")
-    
-    # Draw the text
-    y_pos = start_y
-    logging.info("Drawing greeting")
-    for i, line in enumerate(greeting_lines):
-        draw.text((greeting_x_positions[i], y_pos), line, font=font, fill=text_color)
-        y_pos += line_spacing
-    
-    y_pos += line_spacing  # Gap
-    logging.info("Drawing body" + (" (centered)" if is_poem else ""))
-    for i, line in enumerate(body_lines):
-        draw.text((body_x_positions[i], y_pos), line, font=font, fill=text_color)
-        y_pos += line_spacing
-    
-    y_pos += line_spacing  # Gap
-    logging.info("Drawing sign-off (right-aligned)")
-    for i, line in enumerate(signoff_lines):
-        draw.text((signoff_x_positions[i], y_pos), line, font=font, fill=text_color)
-        y_pos += line_spacing
-    
-    return image
+    plan = layout_letter(greeting, body, signoff, image.width, image.height)
+    return render_layout_image(image, plan)
 
 def create_letter_png(file_name, greeting, body, signoff, 
                      width_mm=127, height_mm=177.8, dpi=300):
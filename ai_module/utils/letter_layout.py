@@ -0,0 +1,241 @@
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfbase import pdfmetrics
+from PIL import ImageDraw, ImageFont
+from functools import lru_cache
+from io import BytesIO
+import threading
+import logging
+import copy
+
+from ai_module.utils.font_registry import font_registry
+from ai_module.utils.glyph_metrics import get_glyph_metrics, font_digest
+from ai_module.utils.text_wrap import wrap_words
+
+
+# Letter typography
+LETTER_FONT = "wilson-p4chbsdco3fw3f363hr4acd9fr (1).ttf"
+TEXT_COLOR = (23, 89, 141)
+MARGIN_PERCENT = 0.15
+MIN_FONT_SIZE = 10
+MAX_FONT_SIZE = 1000
+LINE_SPACING_FACTOR = 1.4
+
+# Number of solved layouts kept, keyed by the texts, the box and the font
+LAYOUT_CACHE_SIZE = 256
+
+# Points per pixel of the 300 DPI letter images
+PIXELS_TO_POINTS = 72 / 300
+
+
+def get_font(font_name=LETTER_FONT, size=100):
+    """
+    Returns a font at a size from the shared font registry, or Pillow's default font if it cannot be loaded.
+    """
+    try:
+        return font_registry.get(font_name, size)
+    except Exception as e:
+        logging.error(f"Failed to load font '{font_name}': {e}. Using default font")
+        return ImageFont.load_default()
+
+
+def get_text_measurer(size, font_name=LETTER_FONT, use_table=True):
+    """
+    Returns the text width and character-pair kerning functions of a font size, from the
+    font's glyph metrics table or from FreeType. The kerning function is None when lines
+    have to be measured whole.
+
+    The table models Pillow's basic layout only, so it is used when the font is laid out
+    with Layout.BASIC; under raqm the font itself measures the text.
+    """
+    font = get_font(font_name, size)
+    measure = font.getlength
+    if getattr(font, "layout_engine", None) != ImageFont.Layout.BASIC:
+        # Shaping can change glyphs at the joins, so lines have to be measured whole
+        return measure, None
+    metrics = get_glyph_metrics(font_name) if use_table else None
+    if metrics is not None:
+        return (lambda text: metrics.text_width(text, size)), (lambda left, right: metrics.kerning_between(left, right, size))
+    pairs = {}
+
+    def kerning(left, right):
+        if (left, right) not in pairs:
+            pairs[(left, right)] = measure(left + right) - measure(left) - measure(right)
+        return pairs[(left, right)]
+    return measure, kerning
+
+
+def layout_block(text, size, max_width, font_name=LETTER_FONT, keep_lines=False):
+    """
+    Splits a block of text into lines at a font size: wrapped to max_width, or along its
+    own line breaks with keep_lines (poems and sign-offs).
+
+    Returns:
+    tuple: The lines and their widths.
+    """
+    measure, kerning = get_text_measurer(size, font_name)
+    if keep_lines:
+        lines = [line.strip() for line in text.split('\n') if line.strip()]
+        return lines, [measure(line) for line in lines]
+    return wrap_words(text.split(), max_width, measure, kerning)
+
+
+@lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def _solve_layout(greeting, body, signoff, width, height, x_offset, font_name):
+    width_margin = int(width * MARGIN_PERCENT)
+    height_margin = int(height * MARGIN_PERCENT)
+    max_width = width - (2 * width_margin)
+    usable_height = height - (2 * height_margin)
+    logging.info(f"Width margin: {width_margin}px, Height margin: {height_margin}px")
+    logging.info(f"Max text width: {max_width}px, Usable height: {usable_height}px")
+
+    # A body with more than 2 newlines is a poem, kept line by line and centered
+    new_line_count = body.count('\n')
+    is_poem = new_line_count > 2
+    logging.info(f"Body has {new_line_count} newlines. Is poem: {is_poem}")
+
+    def blocks(size):
+        return (
+            ("greeting", "left", *layout_block(greeting, size, max_width, font_name)),
+            ("body", "center" if is_poem else "left", *layout_block(body, size, max_width, font_name, is_poem)),
+            ("signoff", "right", *layout_block(signoff, size, max_width, font_name, True))
+        )
+
+    # Binary search for the largest size whose lines fit the height, and the body the width
+    left, right = MIN_FONT_SIZE, MAX_FONT_SIZE
+    font_size = MIN_FONT_SIZE
+    while left <= right:
+        mid = (left + right) // 2
+        sized = blocks(mid)
+        # Two line gaps separate the three blocks
+        total_lines = sum(len(lines) for _, _, lines, _ in sized) + 2
+        total_height = total_lines * int(mid * LINE_SPACING_FACTOR)
+        body_fits = max(sized[1][3], default=0) <= max_width
+        logging.info(f"Testing font size {mid}: Total lines: {total_lines}, Height: {total_height}px, "
+                     f"Body fits width: {body_fits}")
+        if total_height <= usable_height and body_fits:
+            font_size = mid
+            left = mid + 1
+        else:
+            right = mid - 1
+    logging.info(f"Optimal font size selected: {font_size}")
+
+    line_spacing = int(font_size * LINE_SPACING_FACTOR)
+    sized = blocks(font_size)
+    total_height = (sum(len(lines) for _, _, lines, _ in sized) + 2) * line_spacing
+    y = height_margin + (usable_height - total_height) // 2
+    logging.info(f"Total content height: {total_height}px, Starting y-position: {y}px")
+
+    placed = []
+    for block, align, lines, widths in sized:
+        for line, line_width in zip(lines, widths):
+            x = x_offset + width_margin
+            if align == "center":
+                x += (max_width - line_width) / 2
+            elif align == "right":
+                x += max_width - line_width
+            placed.append({"text": line, "x": x, "y": y, "width": line_width, "block": block, "align": align})
+            y += line_spacing
+        y += line_spacing  # Gap
+
+    return {
+        "font": font_name,
+        "font_size": font_size,
+        "ascent": get_font(font_name, font_size).getmetrics()[0],
+        "line_spacing": line_spacing,
+        "color": list(TEXT_COLOR),
+        "width": width,
+        "height": height,
+        "x_offset": x_offset,
+        "is_poem": is_poem,
+        "lines": placed
+    }
+
+
+def layout_letter(greeting, body, signoff, width, height, x_offset=0, font_name=LETTER_FONT):
+    """
+    Lays out a letter in a box of the page: the greeting and a wrapped body left-aligned (a
+    poem body keeps its lines and is centered) and the sign-off right-aligned, at the largest
+    font size that fits within 15% margins, vertically centered.
+
+    Layouts are solved once per card and cached; the returned plan is a copy.
+
+    Args:
+    greeting (str): The greeting.
+    body (str): The message.
+    signoff (str): The sign-off, its lines separated by newlines.
+    width (int): Width of the box, in pixels.
+    height (int): Height of the box and of the page, in pixels.
+    x_offset (int): Left edge of the box on the page, in pixels.
+    font_name (str): The TrueType font file.
+
+    Returns:
+    dict: JSON-serializable layout plan with the font, font_size, ascent, line_spacing,
+    color, the box, is_poem and the lines, each {"text", "x", "y", "width", "block", "align"}
+    with x, y the top-left of the line on the page in pixels.
+    """
+    return copy.deepcopy(_solve_layout(greeting, body, signoff, width, height, x_offset, font_name))
+
+
+def layout_cache_info():
+    """
+    Returns the hits, misses and size of the layout cache.
+    """
+    info = _solve_layout.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
+
+
+def render_layout_image(image, plan):
+    """
+    Draws a layout plan onto a Pillow image of the page.
+    """
+    draw = ImageDraw.Draw(image)
+    font = get_font(plan["font"], plan["font_size"])
+    color = tuple(plan["color"])
+    for line in plan["lines"]:
+        draw.text((line["x"], line["y"]), line["text"], font=font, fill=color)
+    return image
+
+
+_pdf_fonts = {}
+_pdf_fonts_lock = threading.Lock()
+
+
+def get_pdf_font(font_name=LETTER_FONT):
+    """
+    Registers a TrueType font with reportlab once per process and returns its name there.
+    """
+    with _pdf_fonts_lock:
+        if font_name not in _pdf_fonts:
+            pdf_name = f"Letter-{font_digest(font_name)[:12]}"
+            pdfmetrics.registerFont(TTFont(pdf_name, BytesIO(font_registry.font_bytes(font_name))))
+            _pdf_fonts[font_name] = pdf_name
+        return _pdf_fonts[font_name]
+
+
+def render_layout_pdf(pdf_canvas, plan, scale=PIXELS_TO_POINTS, origin=(0, 0)):
+    """
+    Draws a layout plan onto the current page of a reportlab canvas as vector text in the
+    embedded font.
+
+    Args:
+    pdf_canvas (Canvas): The reportlab canvas.
+    plan (dict): Layout plan from layout_letter.
+    scale (float): Points per plan pixel.
+    origin (tuple): Bottom-left corner of the plan's page on the canvas, in points.
+
+    Centered and right-aligned lines are placed with the PDF font's own widths, which are
+    not hinted, so they keep their alignment.
+    """
+    pdf_font = get_pdf_font(plan["font"])
+    font_size = plan["font_size"] * scale
+    origin_x, origin_y = origin
+    pdf_canvas.setFont(pdf_font, font_size)
+    pdf_canvas.setFillColorRGB(*(channel / 255 for channel in plan["color"]))
+    for line in plan["lines"]:
+        x = line["x"] * scale
+        if line["align"] != "left":
+            drift = line["width"] * scale - pdfmetrics.stringWidth(line["text"], pdf_font, font_size)
+            x += drift / 2 if line["align"] == "center" else drift
+        # Pillow places the top of the ascender at y, the PDF the baseline
+        y = (plan["height"] - line["y"] - plan["ascent"]) * scale
+        pdf_canvas.drawString(origin_x + x, origin_y + y, line["text"])
@@ -0,0 +1,599 @@
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError
+import contextvars
+import contextlib
+import threading
+import logging
+import asyncio
+import weakref
+import random
+import httpx
+import time
+import os
+
+from ai_module.utils.helpers import load_config
+from ai_module.utils.llm_usage import UsageTracker, LatencyWindow
+from ai_module.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from ai_module.utils.rate_limiter import UpstreamLimiter, RateLimitExceeded
+from ai_module.utils.llm_providers import OpenAIProvider, build_provider
+from ai_module.utils.llm_router import Backend, LatencyRouter, NoBackendAvailable
+
+# Load configuration
+config = load_config()
+
+# HTTP/2 needs the optional h2 package
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+LLM_BASE_URL = config.get('LLM', 'base_url', fallback="https://generativelanguage.googleapis.com/v1beta/openai/")
+LLM_MODEL = config.get('LLM', 'model', fallback="gemini-1.5-flash")
+LLM_POOL_SIZE = config.getint('LLM', 'pool_size', fallback=20)
+LLM_KEEPALIVE_CONNECTIONS = config.getint('LLM', 'keepalive_connections', fallback=LLM_POOL_SIZE)
+LLM_KEEPALIVE_EXPIRY = config.getfloat('LLM', 'keepalive_expiry_seconds', fallback=60.0)
+LLM_CONNECT_TIMEOUT = config.getfloat('LLM', 'connect_timeout_seconds', fallback=5.0)
+LLM_READ_TIMEOUT = config.getfloat('LLM', 'read_timeout_seconds', fallback=60.0)
+LLM_MAX_RETRIES = config.getint('LLM', 'max_retries', fallback=2)
+LLM_RETRY_BASE_DELAY = config.getfloat('LLM', 'retry_base_delay_seconds', fallback=0.5)
+LLM_RETRY_MAX_DELAY = config.getfloat('LLM', 'retry_max_delay_seconds', fallback=8.0)
+# Total time budget of one generation request, shared by all the LLM calls it makes
+LLM_REQUEST_DEADLINE = config.getfloat('LLM', 'request_deadline_seconds', fallback=30.0)
+# Hedging: send a second identical request when the first is slower than the recent p95
+LLM_HEDGE_ENABLED = config.getboolean('LLM', 'hedge_enabled', fallback=False)
+LLM_HEDGE_PERCENTILE = config.getfloat('LLM', 'hedge_percentile', fallback=95.0)
+LLM_HEDGE_MIN_DELAY = config.getfloat('LLM', 'hedge_min_delay_seconds', fallback=0.5)
+LLM_HEDGE_MIN_SAMPLES = config.getint('LLM', 'hedge_min_samples', fallback=20)
+LLM_HTTP2 = config.getboolean('LLM', 'http2', fallback=True) and HTTP2_AVAILABLE
+# Ask for token usage in the last chunk of streamed completions, where the provider supports it
+LLM_STREAM_USAGE = config.getboolean('LLM', 'stream_include_usage', fallback=False)
+# Provider of the completions: "openai" (the API), "record" (the API, with every call appended to
+# the cassette) or "replay" (the recorded responses, offline, with synthetic latency)
+LLM_PROVIDER = config.get('LLM', 'provider', fallback='openai').strip().lower()
+LLM_CASSETTE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    config.get('LLM', 'cassette_path', fallback='llm_cassettes.jsonl')
+)
+# Optional backends the live calls are routed over by latency, each configured in an [LLM_BACKEND:<name>] section
+LLM_BACKENDS = [name.strip() for name in config.get('LLM', 'backends', fallback='').split(',') if name.strip()]
+
+# Token, latency and retry accounting of every completion call
+usage_tracker = UsageTracker(
+    prompt_cost_per_1k=config.getfloat('LLM', 'prompt_cost_per_1k_tokens', fallback=0.0),
+    completion_cost_per_1k=config.getfloat('LLM', 'completion_cost_per_1k_tokens', fallback=0.0),
+    recent_calls=config.getint('LLM', 'usage_recent_calls', fallback=100)
+)
+
+# Optional circuit breaker that stops calling the upstream while it fails or is too slow
+LLM_CIRCUIT_BREAKER_ENABLED = config.getboolean('CIRCUIT_BREAKER', 'enabled', fallback=False)
+circuit_breaker = CircuitBreaker(
+    window_size=config.getint('CIRCUIT_BREAKER', 'window_size', fallback=20),
+    min_calls=config.getint('CIRCUIT_BREAKER', 'min_calls', fallback=10),
+    error_rate_threshold=config.getfloat('CIRCUIT_BREAKER', 'error_rate_threshold', fallback=0.5),
+    slow_call_seconds=config.getfloat('CIRCUIT_BREAKER', 'slow_call_seconds', fallback=20.0),
+    slow_call_rate_threshold=config.getfloat('CIRCUIT_BREAKER', 'slow_call_rate_threshold', fallback=0.5),
+    open_seconds=config.getfloat('CIRCUIT_BREAKER', 'open_seconds', fallback=30.0),
+    half_open_max_calls=config.getint('CIRCUIT_BREAKER', 'half_open_max_calls', fallback=1)
+)
+
+# Optional limiter of upstream requests and tokens per minute, with adaptive concurrency
+LLM_RATE_LIMIT_ENABLED = config.getboolean('RATE_LIMIT', 'enabled', fallback=False)
+rate_limiter = UpstreamLimiter(
+    requests_per_minute=config.getint('RATE_LIMIT', 'requests_per_minute', fallback=300),
+    tokens_per_minute=config.getint('RATE_LIMIT', 'tokens_per_minute', fallback=200000),
+    max_wait_seconds=config.getfloat('RATE_LIMIT', 'max_wait_seconds', fallback=10.0),
+    min_concurrency=config.getint('RATE_LIMIT', 'min_concurrency', fallback=2),
+    max_concurrency=config.getint('RATE_LIMIT', 'max_concurrency', fallback=LLM_POOL_SIZE),
+    latency_target_seconds=config.getfloat('RATE_LIMIT', 'latency_target_seconds', fallback=10.0),
+    decrease_factor=config.getfloat('RATE_LIMIT', 'decrease_factor', fallback=0.7)
+)
+# Completion tokens assumed for the rate budget when a call sets no max_tokens
+DEFAULT_COMPLETION_TOKENS = 512
+
+# Monotonic deadline of the LLM calls made in the current context, None for no deadline
+_deadline = contextvars.ContextVar('llm_deadline', default=None)
+
+# Recent latencies of successful calls, per purpose, that the hedge delay is derived from
+_latency_windows = {}
+_latency_windows_lock = threading.Lock()
+
+# Retry, deadline and hedging counters
+client_stats = {"retries": 0, "retries_exhausted": 0, "non_retryable_errors": 0, "deadline_exceeded": 0,
+                "hedges": 0, "hedge_wins": 0}
+client_stats_lock = threading.Lock()
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when the deadline of a request is reached before an LLM call could complete.
+    """
+
+_provider = None
+_provider_lock = threading.Lock()
+
+# Async clients are bound to the event loop they were created on
+_async_clients = weakref.WeakKeyDictionary()
+_async_clients_lock = threading.Lock()
+
+# Event loop used to run async code on behalf of synchronous callers
+_background_loop = None
+_background_thread = None
+_background_lock = threading.Lock()
+
+
+def get_api_key():
+    """
+    Returns the API key for the LLM endpoint, preferring [LLM] api_key over the legacy [OPENAI] GOOGLE_API_KEY.
+    """
+    return config.get('LLM', 'api_key', fallback=None) or config['OPENAI']['GOOGLE_API_KEY']
+
+
+def get_timeout():
+    """
+    Returns the connect/read timeouts applied to every LLM request.
+    """
+    return httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+
+def get_limits():
+    """
+    Returns the connection pool limits shared by all LLM requests in the process.
+    """
+    return httpx.Limits(
+        max_connections=LLM_POOL_SIZE,
+        max_keepalive_connections=LLM_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+    )
+
+
+def record_completion(model, completion, start, retries, usage=None, error=None):
+    """
+    Records the tokens, latency and retries of a finished completion call.
+    """
+    tokens = getattr(completion, 'usage', None)
+    usage_tracker.record(
+        # The router may have sent the call to another model than the requested one
+        getattr(completion, 'model', None) or model,
+        getattr(tokens, 'prompt_tokens', None) or 0,
+        getattr(tokens, 'completion_tokens', None) or 0,
+        time.monotonic() - start,
+        retries=retries,
+        labels=usage,
+        error=error
+    )
+
+
+def count(stat, n=1):
+    with client_stats_lock:
+        client_stats[stat] += n
+
+
+@contextlib.contextmanager
+def llm_deadline(seconds=None):
+    """
+    Sets the deadline of every LLM call made inside the block, in this thread or task.
+
+    A deadline that is already set and earlier is kept, so nested scopes can only shorten it.
+
+    Args:
+    seconds (float): Time budget from now. Defaults to [LLM] request_deadline_seconds; 0 or less means none.
+    """
+    seconds = LLM_REQUEST_DEADLINE if seconds is None else seconds
+    deadline = time.monotonic() + seconds if seconds > 0 else None
+    current = _deadline.get()
+    if current is not None and (deadline is None or current < deadline):
+        deadline = current
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time():
+    """
+    Returns the seconds left until the current deadline, or None when there is none.
+    """
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def request_timeout():
+    """
+    Returns the timeout of the next HTTP attempt: the configured timeouts, clipped to the deadline.
+
+    Raises:
+    DeadlineExceeded: If the deadline has already passed.
+    """
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        count("deadline_exceeded")
+        raise DeadlineExceeded("The request deadline was reached before the LLM call completed.")
+    read = LLM_READ_TIMEOUT if remaining is None else min(LLM_READ_TIMEOUT, remaining)
+    return httpx.Timeout(read, connect=min(LLM_CONNECT_TIMEOUT, read))
+
+
+def is_retryable(error):
+    """
+    Returns True for transient errors: timeouts, connection errors, 408, 409, 429 and 5xx responses.
+    """
+    if isinstance(error, APIConnectionError):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def retry_delay(error, retries):
+    """
+    Returns how long to wait before retrying a failed attempt, or None if it must not be retried.
+
+    Retryable errors are retried up to [LLM] max_retries times with exponential backoff and
+    full jitter, and only while the wait still leaves time before the deadline.
+    """
+    if isinstance(error, (DeadlineExceeded, CircuitOpenError, RateLimitExceeded, NoBackendAvailable)):
+        return None
+    if not is_retryable(error):
+        count("non_retryable_errors")
+        return None
+    delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** retries))
+    # A throttled request waits at least as long as the provider asks
+    if isinstance(error, APIStatusError) and error.status_code == 429:
+        try:
+            delay = max(delay, float(error.response.headers.get('retry-after', 0)))
+        except ValueError:
+            pass
+    remaining = remaining_time()
+    if retries >= LLM_MAX_RETRIES or (remaining is not None and delay >= remaining):
+        count("retries_exhausted")
+        return None
+    count("retries")
+    return delay
+
+
+def breaker_allow():
+    """
+    Raises CircuitOpenError if the circuit breaker rejects the next upstream attempt.
+    """
+    if LLM_CIRCUIT_BREAKER_ENABLED and not circuit_breaker.allow():
+        raise CircuitOpenError("The LLM upstream is failing or too slow; the circuit is open.")
+
+
+def breaker_record(error, latency):
+    """
+    Reports the outcome of an upstream attempt to the circuit breaker. Only transient
+    errors count as failures; other errors, such as bad requests, are neutral.
+    """
+    if LLM_CIRCUIT_BREAKER_ENABLED:
+        circuit_breaker.record(error is None if error is None or is_retryable(error) else None, latency)
+
+
+def estimate_tokens(messages, kwargs):
+    """
+    Estimates the prompt plus completion tokens of a request for the rate limiter,
+    at about four characters per prompt token.
+    """
+    prompt_tokens = sum(len(message.get('content') or "") for message in messages) // 4
+    return prompt_tokens + (kwargs.get('max_tokens') or DEFAULT_COMPLETION_TOKENS)
+
+
+def limiter_release(start, estimated, completion=None, error=None):
+    """
+    Releases a rate limiter slot, settling the token estimate against the reported usage.
+    """
+    if not LLM_RATE_LIMIT_ENABLED:
+        return
+    tokens = getattr(getattr(completion, 'usage', None), 'total_tokens', None)
+    rate_limiter.release(
+        time.monotonic() - start,
+        throttled=isinstance(error, APIStatusError) and error.status_code == 429,
+        token_correction=tokens - estimated if tokens else 0
+    )
+
+
+def raise_for_deadline(error):
+    """
+    Raises DeadlineExceeded from a failed attempt when the deadline has run out, so callers
+    can tell an exhausted time budget from a provider error.
+    """
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0 and not isinstance(error, DeadlineExceeded):
+        count("deadline_exceeded")
+        raise DeadlineExceeded("The request deadline was reached before the LLM call completed.") from error
+
+
+def latency_window(purpose):
+    """
+    Returns the rolling latency window of a call purpose.
+    """
+    with _latency_windows_lock:
+        return _latency_windows.setdefault(purpose, LatencyWindow())
+
+
+def hedge_delay(purpose):
+    """
+    Returns the delay after which a call of this purpose is hedged, or None while there are
+    too few latency samples to know its p95.
+    """
+    window = latency_window(purpose)
+    if len(window) < LLM_HEDGE_MIN_SAMPLES:
+        return None
+    return max(window.percentile(LLM_HEDGE_PERCENTILE), LLM_HEDGE_MIN_DELAY)
+
+
+async def hedged(create, delay):
+    """
+    Runs create(), and if it has not finished after `delay` seconds, runs it a second time
+    and returns whichever result arrives first. The slower request is cancelled.
+    """
+    first = asyncio.ensure_future(create())
+    if delay is None:
+        return await first
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result()
+
+    count("hedges")
+    second = asyncio.ensure_future(create())
+    pending = {first, second}
+    try:
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        count("hedge_wins")
+                    return task.result()
+            if not pending:
+                # Both requests failed; surface the error of the last one
+                return task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def client_snapshot():
+    """
+    Returns the retry, deadline and hedging counters and the current hedge delay per purpose.
+    """
+    with client_stats_lock:
+        stats = dict(client_stats)
+    with _latency_windows_lock:
+        purposes = list(_latency_windows)
+    stats.update(
+        hedge_enabled=LLM_HEDGE_ENABLED,
+        hedge_delay_seconds={purpose: hedge_delay(purpose) for purpose in purposes},
+        request_deadline_seconds=LLM_REQUEST_DEADLINE,
+        provider=get_provider().snapshot()
+    )
+    return stats
+
+
+def new_async_client(base_url, api_key):
+    """
+    Creates an async OpenAI-compatible client with the shared pool limits and timeouts.
+    """
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        timeout=get_timeout(),
+        max_retries=0,
+        http_client=httpx.AsyncClient(limits=get_limits(), timeout=get_timeout(), http2=LLM_HTTP2)
+    )
+
+
+def build_router():
+    """
+    Creates the latency router over the [LLM] backends. A backend section may set base_url,
+    model, api_key, weight and max_concurrency; unset values default to the [LLM] ones.
+    """
+    backends = []
+    for name in LLM_BACKENDS:
+        section = f'LLM_BACKEND:{name}'
+        if not config.has_section(section):
+            raise ValueError(f"The LLM backend '{name}' has no [{section}] section.")
+        backends.append(Backend(
+            name,
+            base_url=config.get(section, 'base_url', fallback=LLM_BASE_URL),
+            model=config.get(section, 'model', fallback=LLM_MODEL),
+            api_key=config.get(section, 'api_key', fallback=None) or get_api_key(),
+            weight=config.getfloat(section, 'weight', fallback=1.0),
+            max_concurrency=config.getint(section, 'max_concurrency', fallback=LLM_POOL_SIZE)
+        ))
+    logging.info(f"Routing LLM calls over backends: {', '.join(LLM_BACKENDS)}")
+    return LatencyRouter(
+        backends, new_async_client, is_retryable,
+        percentile=config.getfloat('LLM_ROUTER', 'percentile', fallback=50.0),
+        min_samples=config.getint('LLM_ROUTER', 'min_samples', fallback=5),
+        error_rate_threshold=config.getfloat('LLM_ROUTER', 'error_rate_threshold', fallback=0.5),
+        unhealthy_seconds=config.getfloat('LLM_ROUTER', 'unhealthy_seconds', fallback=30.0),
+        max_wait_seconds=config.getfloat('LLM_ROUTER', 'max_wait_seconds', fallback=10.0)
+    )
+
+
+def get_provider():
+    """
+    Returns the configured LLM provider ([LLM] provider), created on first use.
+    """
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                api_provider = build_router() if LLM_BACKENDS else OpenAIProvider(get_async_client)
+                _provider = build_provider(
+                    LLM_PROVIDER, api_provider, LLM_CASSETTE_PATH,
+                    latency=config.get('LLM', 'replay_latency', fallback='recorded').strip().lower(),
+                    latency_seconds=config.getfloat('LLM', 'replay_latency_seconds', fallback=1.0),
+                    latency_sigma=config.getfloat('LLM', 'replay_latency_sigma', fallback=0.5),
+                    seed=config.getint('LLM', 'replay_seed', fallback=None)
+                )
+    return _provider
+
+
+def get_async_client():
+    """
+    Returns the async OpenAI-compatible client for the running event loop.
+
+    One client (and connection pool) is created per event loop and reused by every
+    coroutine on it, so hundreds of in-flight generations share pooled connections.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        with _async_clients_lock:
+            client = _async_clients.get(loop)
+            if client is None:
+                logging.info(f"Creating async LLM client: pool size {LLM_POOL_SIZE}, HTTP/2 {LLM_HTTP2}")
+                client = new_async_client(LLM_BASE_URL, get_api_key())
+                _async_clients[loop] = client
+    return client
+
+
+async def chat_completion_async(messages, model=None, usage=None, **kwargs):
+    """
+    Runs a chat completion on the configured provider and records its usage. Synchronous
+    callers go through run_sync.
+
+    Each attempt is bounded by the current deadline, and retryable errors are retried
+    with exponential backoff and jitter (see retry_delay). With [RATE_LIMIT] enabled, every
+    HTTP request first queues for the process-wide upstream rate limiter.
+
+    With [LLM] hedge_enabled, a non-streamed call still running after the recent p95 latency
+    of its purpose gets a second, identical request, and the first response wins.
+
+    Streamed completions are recorded when the stream ends, with the token usage of
+    the last chunk if the provider sends one.
+
+    Args:
+    messages (list): Chat messages to send.
+    model (str): Model name. Defaults to the configured [LLM] model.
+    usage (dict): Optional purpose, occasion and template the usage is accounted to.
+    **kwargs: Extra arguments passed to chat.completions.create.
+
+    Returns:
+    ChatCompletion: The provider response, or an async iterator of chunks when streamed.
+    """
+    model = model or LLM_MODEL
+    stream = kwargs.get('stream', False)
+    if stream and LLM_STREAM_USAGE:
+        kwargs.setdefault('stream_options', {"include_usage": True})
+    purpose = (usage or {}).get('purpose') or "other"
+    estimated = estimate_tokens(messages, kwargs)
+    start = time.monotonic()
+    retries = 0
+    while True:
+        try:
+            timeout = request_timeout()
+            breaker_allow()
+            attempt_start = time.monotonic()
+
+            async def create():
+                # Every HTTP request, hedges included, takes its own rate limiter slot. A streamed
+                # request gives its slot back once the response starts.
+                if LLM_RATE_LIMIT_ENABLED:
+                    await rate_limiter.acquire(estimated)
+                sent = time.monotonic()
+                try:
+                    completion = await get_provider().create_async(model, messages, timeout=timeout, **kwargs)
+                except BaseException as e:
+                    limiter_release(sent, estimated, error=e)
+                    raise
+                limiter_release(sent, estimated, completion)
+                return completion
+
+            delay = hedge_delay(purpose) if LLM_HEDGE_ENABLED and not stream else None
+            try:
+                completion = await hedged(create, delay)
+            except BaseException as e:
+                breaker_record(e, time.monotonic() - attempt_start)
+                raise
+            breaker_record(None, time.monotonic() - attempt_start)
+            break
+        except Exception as e:
+            delay = retry_delay(e, retries)
+            if delay is None:
+                record_completion(model, None, start, retries, usage, error=str(e))
+                raise_for_deadline(e)
+                raise
+            logging.warning(f"LLM call failed ({e}), retrying in {delay:.2f}s")
+            retries += 1
+            await asyncio.sleep(delay)
+    if stream:
+        return recorded_stream(completion, model, start, retries, usage)
+    latency_window(purpose).add(time.monotonic() - attempt_start)
+    record_completion(model, completion, start, retries, usage)
+    return completion
+
+
+async def recorded_stream(stream, model, start, retries, usage=None):
+    """
+    Passes the chunks of a streamed completion through and records its usage at the end.
+    """
+    last_usage = None
+    error = None
+    try:
+        async for chunk in stream:
+            if getattr(chunk, 'usage', None):
+                last_usage = chunk
+            yield chunk
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        record_completion(model, last_usage, start, retries, usage, error=error)
+
+
+def get_background_loop():
+    """
+    Returns the process-wide event loop that runs async generations for synchronous
+    callers, starting it in a daemon thread on first use.
+    """
+    global _background_loop, _background_thread
+    if _background_loop is None:
+        with _background_lock:
+            if _background_loop is None:
+                loop = asyncio.new_event_loop()
+                _background_thread = threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True)
+                _background_thread.start()
+                _background_loop = loop
+    return _background_loop
+
+
+def run_sync(coro, timeout=None):
+    """
+    Runs a coroutine on the background event loop and blocks until it finishes.
+
+    Args:
+    coro (coroutine): The coroutine to run.
+    timeout (float): Seconds to wait for the result. None waits indefinitely.
+
+    Returns:
+    The coroutine's result. Exceptions raised by the coroutine are re-raised.
+    """
+    loop = get_background_loop()
+    if threading.current_thread() is _background_thread:
+        coro.close()
+        raise RuntimeError("run_sync cannot be called from the background event loop; await the coroutine instead.")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+
+def iterate_sync(agen):
+    """
+    Iterates an async generator from synchronous code, running each step on the
+    background event loop. The generator is closed if the caller stops early.
+
+    Args:
+    agen (async generator): The async generator to iterate.
+
+    Yields:
+    The items produced by the async generator.
+    """
+    loop = get_background_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
@@ -0,0 +1,245 @@
+from openai import APITimeoutError
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+import threading
+import itertools
+import hashlib
+import logging
+import asyncio
+import random
+import httpx
+import json
+import time
+import os
+
+
+# Request arguments that do not change the response, left out of the cassette key
+UNKEYED_PARAMS = ("timeout", "stream_options")
+
+# Synthetic latency distributions of the replay provider
+REPLAY_LATENCIES = ("recorded", "fixed", "uniform", "lognormal")
+
+
+def cassette_key(model, messages, params):
+    """
+    Returns the key a request is recorded and replayed under: a hash of the model, the
+    messages and the request arguments that shape the response.
+    """
+    params = {name: value for name, value in params.items() if name not in UNKEYED_PARAMS}
+    payload = json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class OpenAIProvider:
+    """
+    Provider calling the OpenAI-compatible API with the shared clients.
+    """
+    name = "openai"
+
+    def __init__(self, get_async_client):
+        """
+        Args:
+        get_async_client (callable): Returns the async client of the running event loop.
+        """
+        self._get_async_client = get_async_client
+
+    async def create_async(self, model, messages, **kwargs):
+        return await self._get_async_client().chat.completions.create(model=model, messages=messages, **kwargs)
+
+    def snapshot(self):
+        return {"provider": self.name}
+
+
+class RecordingProvider:
+    """
+    Provider that passes every request to another provider and appends the request and its
+    response to a JSONL cassette file, one call per line. Streamed responses are recorded
+    chunk by chunk once the stream ends. Failed calls are not recorded.
+    """
+    name = "record"
+
+    def __init__(self, inner, path):
+        """
+        Args:
+        inner: Provider the requests are sent to.
+        path (str): JSONL file the calls are appended to.
+        """
+        self.inner = inner
+        self.path = path
+        self._lock = threading.Lock()
+        self.stats = {"recorded": 0}
+
+    def _write(self, model, messages, kwargs, latency, response=None, chunks=None):
+        entry = {
+            "key": cassette_key(model, messages, kwargs),
+            "request": {"model": model, "messages": messages,
+                        "params": {name: value for name, value in kwargs.items() if name not in UNKEYED_PARAMS}},
+            "latency_seconds": round(latency, 4),
+            "recorded_at": time.time()
+        }
+        if chunks is not None:
+            entry["chunks"] = chunks
+        else:
+            entry["response"] = response.model_dump(mode="json")
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+                self.stats["recorded"] += 1
+            except OSError as e:
+                logging.error(f"Failed to record LLM call to {self.path}: {e}")
+
+    async def create_async(self, model, messages, **kwargs):
+        start = time.monotonic()
+        response = await self.inner.create_async(model, messages, **kwargs)
+        if kwargs.get("stream"):
+            return self._recorded_stream(response, model, messages, kwargs, start)
+        self._write(model, messages, kwargs, time.monotonic() - start, response=response)
+        return response
+
+    async def _recorded_stream(self, stream, model, messages, kwargs, start):
+        chunks = []
+        async for chunk in stream:
+            chunks.append(chunk.model_dump(mode="json"))
+            yield chunk
+        self._write(model, messages, kwargs, time.monotonic() - start, chunks=chunks)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, provider=self.name, path=self.path, inner=self.inner.snapshot())
+
+
+class ReplayProvider:
+    """
+    Offline provider serving the responses of a cassette file, for benchmarks and load tests
+    without network access or an API key.
+
+    A request is answered with the recorded response of the same key. Requests that were
+    never recorded (the prompts contain randomly picked traits and themes) get the recorded
+    responses of the same kind, streamed or not, in turn. Every response is delayed by a
+    synthetic latency: the recorded one, a fixed one, or one drawn from a uniform or
+    lognormal distribution around latency_seconds. A latency beyond the request's read
+    timeout ends in APITimeoutError, like a slow provider would.
+    """
+    name = "replay"
+
+    def __init__(self, path, latency="recorded", latency_seconds=1.0, latency_sigma=0.5, seed=None):
+        """
+        Args:
+        path (str): JSONL cassette file written by RecordingProvider.
+        latency (str): One of REPLAY_LATENCIES.
+        latency_seconds (float): Fixed latency, half-width of the uniform range (which starts at 0),
+            or median of the lognormal distribution.
+        latency_sigma (float): Shape of the lognormal distribution.
+        seed (int): Optional seed of the latency draws.
+
+        Raises:
+        ValueError: If the latency distribution is unknown or the cassette holds no calls.
+        """
+        if latency not in REPLAY_LATENCIES:
+            raise ValueError(f"Unknown replay latency '{latency}', expected one of {', '.join(REPLAY_LATENCIES)}.")
+        self.path = path
+        self.latency = latency
+        self.latency_seconds = latency_seconds
+        self.latency_sigma = latency_sigma
+        self._rng = random.Random(seed)
+        self._entries = {}
+        by_kind = {False: [], True: []}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries[entry["key"]] = entry
+                    by_kind["chunks" in entry].append(entry)
+        if not self._entries:
+            raise ValueError(f"The cassette {path} holds no recorded calls.")
+        self._cycles = {kind: itertools.cycle(entries) for kind, entries in by_kind.items() if entries}
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "substitutes": 0, "timeouts": 0}
+        logging.info(f"Replaying {len(self._entries)} recorded LLM call(s) from {path}")
+
+    def _lookup(self, model, messages, kwargs):
+        stream = bool(kwargs.get("stream"))
+        with self._lock:
+            entry = self._entries.get(cassette_key(model, messages, kwargs))
+            if entry is not None and ("chunks" in entry) == stream:
+                self.stats["exact_hits"] += 1
+                return entry
+            if stream not in self._cycles:
+                raise ValueError(f"The cassette {self.path} holds no {'streamed' if stream else 'non-streamed'} calls.")
+            self.stats["substitutes"] += 1
+            return next(self._cycles[stream])
+
+    def _delay(self, entry, kwargs):
+        """
+        Returns the synthetic latency of a response and whether it runs into the read timeout.
+        """
+        if self.latency == "recorded":
+            delay = entry.get("latency_seconds", 0.0)
+        elif self.latency == "fixed":
+            delay = self.latency_seconds
+        else:
+            with self._lock:
+                if self.latency == "uniform":
+                    delay = self._rng.uniform(0, 2 * self.latency_seconds)
+                else:
+                    delay = self._rng.lognormvariate(0, self.latency_sigma) * self.latency_seconds
+        timeout = kwargs.get("timeout")
+        read_timeout = timeout.read if isinstance(timeout, httpx.Timeout) else timeout
+        if read_timeout is not None and delay > read_timeout:
+            return read_timeout, True
+        return delay, False
+
+    def _timed_out(self):
+        with self._lock:
+            self.stats["timeouts"] += 1
+        return APITimeoutError(request=httpx.Request("POST", "replay://chat/completions"))
+
+    async def create_async(self, model, messages, **kwargs):
+        entry = self._lookup(model, messages, kwargs)
+        delay, timed_out = self._delay(entry, kwargs)
+        if "chunks" in entry:
+            # The stream starts after the latency; the chunks then follow at once
+            await asyncio.sleep(delay)
+            if timed_out:
+                raise self._timed_out()
+            return self._replayed_stream(entry["chunks"])
+        await asyncio.sleep(delay)
+        if timed_out:
+            raise self._timed_out()
+        return ChatCompletion.model_validate(entry["response"])
+
+    @staticmethod
+    async def _replayed_stream(chunks):
+        for chunk in chunks:
+            yield ChatCompletionChunk.model_validate(chunk)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, provider=self.name, path=self.path, recorded_calls=len(self._entries),
+                        latency=self.latency)
+
+
+def build_provider(kind, api_provider, cassette_path, **replay_options):
+    """
+    Creates the configured LLM provider.
+
+    Args:
+    kind (str): "openai", "record" or "replay".
+    api_provider: Provider of the live API calls, an OpenAIProvider or a LatencyRouter.
+    cassette_path (str): JSONL cassette file written by "record" and read by "replay".
+    **replay_options: latency, latency_seconds, latency_sigma and seed of ReplayProvider.
+
+    Raises:
+    ValueError: If the provider kind is unknown.
+    """
+    if kind == "openai":
+        return api_provider
+    if kind == "record":
+        logging.info(f"Recording LLM calls to {cassette_path}")
+        return RecordingProvider(api_provider, cassette_path)
+    if kind == "replay":
+        if not os.path.exists(cassette_path):
+            raise ValueError(f"The replay cassette {cassette_path} does not exist.")
+        return ReplayProvider(cassette_path, **replay_options)
+    raise ValueError(f"Unknown LLM provider '{kind}', expected openai, record or replay.")
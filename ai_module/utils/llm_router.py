@@ -0,0 +1,200 @@
+from collections import deque
+import threading
+import logging
+import asyncio
+import weakref
+import time
+
+from ai_module.utils.llm_usage import LatencyWindow
+
+
+# Interval at which a request re-checks for a backend with a free slot
+POLL_INTERVAL_SECONDS = 0.02
+
+
+class NoBackendAvailable(RuntimeError):
+    """
+    Raised when every backend stayed at its concurrency cap for longer than max_wait_seconds.
+    """
+
+
+class Backend:
+    """
+    One provider/model endpoint of the router, with its clients and rolling statistics.
+    """
+
+    def __init__(self, name, base_url, model, api_key, weight=1.0, max_concurrency=10, window_size=200):
+        """
+        Args:
+        name (str): Name of the backend in the configuration and the stats.
+        base_url (str): OpenAI-compatible endpoint.
+        model (str): Model requested from this endpoint.
+        api_key (str): API key of the endpoint.
+        weight (float): Preference of the backend; its latency score is divided by the weight.
+        max_concurrency (int): Maximum requests in flight on this backend.
+        window_size (int): Number of most recent latencies and outcomes considered.
+        """
+        self.name = name
+        self.base_url = base_url
+        self.model = model
+        self.api_key = api_key
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.latencies = LatencyWindow(window_size)
+        self.outcomes = deque(maxlen=window_size)
+        self.in_flight = 0
+        self.unhealthy_since = None
+        self.async_clients = weakref.WeakKeyDictionary()
+        self.stats = {"calls": 0, "errors": 0}
+
+    def error_rate(self):
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+
+class LatencyRouter:
+    """
+    Provider spreading completions over several OpenAI-compatible backends.
+
+    Each request goes to the healthy backend with a free slot and the lowest score, the
+    rolling latency percentile divided by the backend's weight. Backends with fewer than
+    min_samples latencies score 0, so every backend gets measured. A backend whose rolling
+    error rate reaches error_rate_threshold is unhealthy and skipped for unhealthy_seconds,
+    then probed again with a fresh window. When no backend is healthy, all of them are
+    tried rather than failing outright.
+    """
+    name = "router"
+
+    def __init__(self, backends, new_async_client, is_failure, percentile=50.0, min_samples=5,
+                 error_rate_threshold=0.5, unhealthy_seconds=30.0, max_wait_seconds=10.0):
+        """
+        Args:
+        backends (list): Backend instances, in order of preference on ties.
+        new_async_client (callable): Creates an async client from (base_url, api_key).
+        is_failure (callable): Returns True for errors that count against a backend's health.
+        percentile (float): Latency percentile (0-100) the backends are ranked by.
+        min_samples (int): Samples needed before a backend's latency and error rate are trusted.
+        error_rate_threshold (float): Rolling error rate (0-1) that makes a backend unhealthy.
+        unhealthy_seconds (float): Time an unhealthy backend is skipped before it is probed again.
+        max_wait_seconds (float): Longest time a request waits for a backend with a free slot.
+        """
+        if not backends:
+            raise ValueError("The LLM router needs at least one backend.")
+        self.backends = backends
+        self.new_async_client = new_async_client
+        self.is_failure = is_failure
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.error_rate_threshold = error_rate_threshold
+        self.unhealthy_seconds = unhealthy_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self._lock = threading.Lock()
+
+    def _healthy(self, backend, now):
+        if backend.unhealthy_since is None:
+            return True
+        if now - backend.unhealthy_since < self.unhealthy_seconds:
+            return False
+        logging.info(f"Probing LLM backend '{backend.name}' again")
+        backend.unhealthy_since = None
+        backend.outcomes.clear()
+        return True
+
+    def _score(self, backend):
+        if len(backend.latencies) < self.min_samples:
+            return 0.0
+        return backend.latencies.percentile(self.percentile) / backend.weight
+
+    def _try_acquire(self):
+        """
+        Takes a slot on the best backend with one free, or returns None if all are at their cap.
+        """
+        with self._lock:
+            now = time.monotonic()
+            healthy = [backend for backend in self.backends if self._healthy(backend, now)]
+            candidates = [backend for backend in healthy or self.backends
+                          if backend.in_flight < backend.max_concurrency]
+            if not candidates:
+                return None
+            backend = min(candidates, key=lambda b: (self._score(b), b.in_flight / b.max_concurrency))
+            backend.in_flight += 1
+            backend.stats["calls"] += 1
+            return backend
+
+    def _next_wait(self, started):
+        if time.monotonic() - started >= self.max_wait_seconds:
+            raise NoBackendAvailable(f"Every LLM backend stayed at its concurrency cap for {self.max_wait_seconds}s.")
+        return POLL_INTERVAL_SECONDS
+
+    def _release(self, backend, latency, error=None):
+        failed = error is not None and self.is_failure(error)
+        with self._lock:
+            backend.in_flight -= 1
+            if error is not None and not failed:
+                # Errors that are not the backend's fault, such as a bad request, say nothing about it
+                return
+            backend.outcomes.append(failed)
+            if failed:
+                backend.stats["errors"] += 1
+                if (backend.unhealthy_since is None and len(backend.outcomes) >= self.min_samples
+                        and backend.error_rate() >= self.error_rate_threshold):
+                    logging.error(f"LLM backend '{backend.name}' is unhealthy: error rate {backend.error_rate():.2f}")
+                    backend.unhealthy_since = time.monotonic()
+            else:
+                backend.latencies.add(latency)
+
+    def _async_client(self, backend):
+        loop = asyncio.get_running_loop()
+        client = backend.async_clients.get(loop)
+        if client is None:
+            with self._lock:
+                client = backend.async_clients.get(loop)
+                if client is None:
+                    client = self.new_async_client(backend.base_url, backend.api_key)
+                    backend.async_clients[loop] = client
+        return client
+
+    async def create_async(self, model, messages, **kwargs):
+        """
+        Sends a completion to the best backend, with that backend's model. A streamed
+        completion frees its slot once the response starts.
+        """
+        started = time.monotonic()
+        backend = self._try_acquire()
+        while backend is None:
+            await asyncio.sleep(self._next_wait(started))
+            backend = self._try_acquire()
+        start = time.monotonic()
+        try:
+            completion = await self._async_client(backend).chat.completions.create(
+                model=backend.model, messages=messages, **kwargs)
+        except BaseException as e:
+            self._release(backend, time.monotonic() - start, e)
+            raise
+        self._release(backend, time.monotonic() - start)
+        return completion
+
+    def snapshot(self):
+        """
+        Returns the latency percentiles, error rate, load and health of every backend.
+        """
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "provider": self.name,
+                "backends": {
+                    backend.name: dict(
+                        backend.stats,
+                        model=backend.model,
+                        weight=backend.weight,
+                        in_flight=backend.in_flight,
+                        max_concurrency=backend.max_concurrency,
+                        p50_seconds=backend.latencies.percentile(50),
+                        p95_seconds=backend.latencies.percentile(95),
+                        error_rate=backend.error_rate(),
+                        healthy=backend.unhealthy_since is None
+                        or now - backend.unhealthy_since >= self.unhealthy_seconds,
+                        score=self._score(backend)
+                    )
+                    for backend in self.backends
+                }
+            }
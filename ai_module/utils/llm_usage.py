@@ -0,0 +1,129 @@
+from collections import deque
+import threading
+import math
+import time
+
+
+# Dimensions the usage is aggregated by, besides the model
+USAGE_LABELS = ("purpose", "occasion", "template")
+
+
+class UsageTracker:
+    """
+    In-process accounting of upstream LLM calls.
+
+    Every completion call is recorded with its model, prompt and completion tokens,
+    latency and number of retries, and aggregated per model and per label (purpose,
+    occasion and prompt template). The most recent calls are kept individually.
+    """
+
+    def __init__(self, prompt_cost_per_1k=0.0, completion_cost_per_1k=0.0, recent_calls=100):
+        """
+        Args:
+        prompt_cost_per_1k (float): Price of 1000 prompt tokens, used to estimate the spend.
+        completion_cost_per_1k (float): Price of 1000 completion tokens.
+        recent_calls (int): Number of individual calls kept for inspection.
+        """
+        self.prompt_cost_per_1k = prompt_cost_per_1k
+        self.completion_cost_per_1k = completion_cost_per_1k
+        self._totals = self._new_aggregate()
+        self._aggregates = {label: {} for label in ("model",) + USAGE_LABELS}
+        self._recent = deque(maxlen=recent_calls)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _new_aggregate():
+        return {"calls": 0, "errors": 0, "retries": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "latency_seconds": 0.0}
+
+    def cost(self, prompt_tokens, completion_tokens):
+        """
+        Returns the estimated price of a number of prompt and completion tokens.
+        """
+        return (prompt_tokens * self.prompt_cost_per_1k + completion_tokens * self.completion_cost_per_1k) / 1000
+
+    def record(self, model, prompt_tokens, completion_tokens, latency, retries=0, labels=None, error=None):
+        """
+        Records one completion call.
+
+        Args:
+        model (str): Model the call was made to.
+        prompt_tokens (int): Prompt tokens reported by the provider, 0 if unknown.
+        completion_tokens (int): Completion tokens reported by the provider, 0 if unknown.
+        latency (float): Seconds the call took, including retries.
+        retries (int): Number of retried HTTP attempts.
+        labels (dict): Optional purpose, occasion and template of the call.
+        error (str): Error message if the call failed.
+        """
+        labels = {label: value for label, value in (labels or {}).items() if label in USAGE_LABELS and value}
+        call = dict(labels, model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                    latency_seconds=round(latency, 4), retries=retries, time=time.time())
+        if error:
+            call["error"] = error
+        with self._lock:
+            keys = dict(labels, model=model)
+            for aggregate in [self._totals] + [self._aggregates[label].setdefault(value, self._new_aggregate())
+                                               for label, value in keys.items()]:
+                aggregate["calls"] += 1
+                aggregate["errors"] += 1 if error else 0
+                aggregate["retries"] += retries
+                aggregate["prompt_tokens"] += prompt_tokens
+                aggregate["completion_tokens"] += completion_tokens
+                aggregate["latency_seconds"] += latency
+            self._recent.append(call)
+
+    def _summary(self, aggregate):
+        calls = aggregate["calls"]
+        return dict(
+            aggregate,
+            average_latency_seconds=aggregate["latency_seconds"] / calls if calls else 0.0,
+            average_prompt_tokens=aggregate["prompt_tokens"] / calls if calls else 0.0,
+            average_completion_tokens=aggregate["completion_tokens"] / calls if calls else 0.0,
+            cost=self.cost(aggregate["prompt_tokens"], aggregate["completion_tokens"])
+        )
+
+    def snapshot(self):
+        """
+        Returns the totals, the per-model and per-label aggregates and the most recent calls.
+        """
+        with self._lock:
+            return {
+                "totals": self._summary(self._totals),
+                **{f"by_{label}": {value: self._summary(aggregate) for value, aggregate in aggregates.items()}
+                   for label, aggregates in self._aggregates.items()},
+                "recent": list(self._recent)
+            }
+
+
+class LatencyWindow:
+    """
+    Rolling window of the most recent latencies, answering percentile queries.
+    """
+
+    def __init__(self, size=200):
+        """
+        Args:
+        size (int): Number of most recent samples kept.
+        """
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, seconds):
+        """
+        Adds one latency sample.
+        """
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p):
+        """
+        Returns the p-th percentile (0-100) of the window, or None while it is empty.
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, max(math.ceil(p / 100 * len(samples)) - 1, 0))]
@@ -0,0 +1,83 @@
+from collections import OrderedDict
+import threading
+import time
+
+from ai_module.utils.occasions import normalize_key
+from ai_module.utils.schemas import STYLES
+
+
+class MessageCache:
+    """
+    In-memory LRU + TTL cache of generated message sets, keyed on the normalized request.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600):
+        """
+        Args:
+        max_entries (int): Maximum number of message sets kept before the least recently used is evicted.
+        ttl_seconds (int): Age after which a cached message set is no longer served.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        """
+        Returns the cached value for a key, or None on a miss or expired entry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] >= self.ttl_seconds:
+                if entry is not None:
+                    del self._entries[key]
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """
+        Stores a value, evicting the least recently used entry when full.
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def snapshot(self):
+        """
+        Returns the hit/miss counters together with the current cache size.
+        """
+        with self._lock:
+            return dict(self.stats, size=len(self._entries))
+
+
+def build_message_key(name, relationship, occasion, age_years, gender, character_traits, message_theme, seed,
+                      styles=None, length_budget=None):
+    """
+    Builds the cache key of a generation request.
+
+    The key holds everything the prompt depends on: name, relationship, canonical occasion,
+    age in years, gender, the sorted traits and themes, the seed that drives the random
+    trait, theme and prompt choices, and the requested styles and length budget.
+
+    Returns:
+    tuple: Hashable cache key.
+    """
+    return (
+        " ".join(name.split()).lower(),
+        normalize_key(relationship),
+        occasion,
+        age_years,
+        normalize_key(gender),
+        tuple(sorted(normalize_key(t) for t in character_traits)),
+        tuple(sorted(normalize_key(t) for t in message_theme)),
+        seed,
+        tuple(styles or STYLES),
+        tuple(sorted(length_budget.items())) if length_budget else None
+    )
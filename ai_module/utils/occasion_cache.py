@@ -0,0 +1,123 @@
+from collections import OrderedDict
+import threading
+import logging
+import asyncio
+import json
+import time
+import os
+
+
+class OccasionSpiritCache:
+    """
+    LRU + TTL cache of LLM-generated occasion descriptions ("spirit of the event").
+
+    Entries are persisted to a JSON file so a restart does not pay the LLM
+    round-trip again for occasions that were already described.
+    """
+
+    def __init__(self, path, max_entries=256, ttl_seconds=30 * 24 * 3600):
+        """
+        Args:
+        path (str): JSON file the cache is persisted to. None disables persistence.
+        max_entries (int): Maximum number of descriptions kept before the least recently used is evicted.
+        ttl_seconds (int): Age after which a description is considered stale and regenerated.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.stats = {"builtin_hits": 0, "cache_hits": 0, "misses": 0, "evictions": 0}
+        self._load()
+
+    @staticmethod
+    def _key(occasion):
+        return " ".join(occasion.split()).lower()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Failed to load occasion spirit cache from {self.path}: {e}")
+            return
+
+        now = time.time()
+        # Oldest first so the most recently stored entries end up most recently used
+        for key, entry in sorted(data.items(), key=lambda item: item[1].get("created", 0)):
+            if now - entry.get("created", 0) < self.ttl_seconds and entry.get("description"):
+                self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        logging.info(f"Loaded {len(self._entries)} occasion spirit(s) from {self.path}")
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        # One writer at a time, each writing the entries as of its turn, so the newest set wins
+        with self._save_lock:
+            with self._lock:
+                data = dict(self._entries)
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logging.error(f"Failed to persist occasion spirit cache to {self.path}: {e}")
+
+    def get(self, occasion):
+        """
+        Returns the cached description for an occasion, or None on a miss or stale entry.
+        """
+        key = self._key(occasion)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry["created"] >= self.ttl_seconds:
+                if entry is not None:
+                    del self._entries[key]
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["cache_hits"] += 1
+            return entry["description"]
+
+    def _store(self, occasion, description):
+        key = self._key(occasion)
+        with self._lock:
+            self._entries[key] = {"occasion": occasion, "description": description, "created": time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def set(self, occasion, description):
+        """
+        Stores a description, evicting the least recently used entry when full, and persists the cache.
+        """
+        self._store(occasion, description)
+        self._save()
+
+    async def set_async(self, occasion, description):
+        """
+        Like set, but writes the file in a worker thread so the event loop is not blocked.
+        """
+        self._store(occasion, description)
+        await asyncio.to_thread(self._save)
+
+    def record_builtin_hit(self):
+        """
+        Counts a lookup that was answered by the built-in descriptions without touching the cache.
+        """
+        with self._lock:
+            self.stats["builtin_hits"] += 1
+
+    def snapshot(self):
+        """
+        Returns the hit/miss counters together with the current cache size.
+        """
+        with self._lock:
+            return dict(self.stats, size=len(self._entries))
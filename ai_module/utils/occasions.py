@@ -0,0 +1,132 @@
+from functools import lru_cache
+import json
+import os
+import re
+
+
+# Shortest input corrected as a misspelling; shorter keys are too easily another word
+TYPO_MIN_LENGTH = 5
+
+
+def normalize_key(text):
+    """
+    Normalizes an occasion or trait name for lookups: lower case with everything
+    but letters and digits removed, so "Mothers Day", "mother's day" and
+    "MOTHER'S  DAY" all map to the same key.
+    """
+    return re.sub(r'[^0-9a-z]', '', text.lower()) if text else ""
+
+
+def load_registry(path=None):
+    """
+    Loads the occasion registry JSON file and indexes every canonical name and alias
+    by its normalized key.
+
+    Args:
+    path (str): Path of the registry file. Defaults to occasions.json next to this module.
+
+    Returns:
+    tuple: (index dict of normalized key -> occasion entry, default entry for unknown occasions)
+    """
+    if path is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'occasions.json')
+
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    default = data['default']
+    index = {}
+    for entry in data['occasions']:
+        entry.setdefault('important_traits', default['important_traits'])
+        entry.setdefault('prompt_variants', default['prompt_variants'])
+        entry.setdefault('greeting', f"Happy {entry['name']}")
+        entry.setdefault('keywords', default['keywords'])
+        entry['trait_keys'] = frozenset(normalize_key(t) for t in entry['important_traits'])
+        for name in [entry['name']] + entry.get('aliases', []):
+            index[normalize_key(name)] = entry
+
+    return index, default
+
+
+# Loaded once at import
+OCCASION_INDEX, DEFAULT_OCCASION = load_registry()
+
+
+def is_typo(key, name):
+    """
+    Returns True if a normalized key is a name with a single typing slip: one wrong letter,
+    two neighbouring letters swapped, or one letter doubled or undoubled ("christmass").
+    The first letter must match, and an added or dropped letter that is not a repeat
+    makes another word ("Eastern", "Others Day") rather than a typo.
+    """
+    if not key or not name or key[0] != name[0]:
+        return False
+    if len(key) == len(name):
+        diffs = [i for i, (a, b) in enumerate(zip(key, name)) if a != b]
+        if len(diffs) == 1:
+            return True
+        return (len(diffs) == 2 and diffs[1] == diffs[0] + 1
+                and key[diffs[0]] == name[diffs[1]] and key[diffs[1]] == name[diffs[0]])
+    longer, shorter = (key, name) if len(key) > len(name) else (name, key)
+    if len(longer) - len(shorter) != 1:
+        return False
+    return any(longer[i] == longer[i - 1] and longer[:i] + longer[i + 1:] == shorter
+               for i in range(1, len(longer)))
+
+
+@lru_cache(maxsize=1024)
+def _resolve_key(key):
+    entry = OCCASION_INDEX.get(key)
+    if entry is not None:
+        return entry
+    # Digits distinguish occasions ("Birthday 2", "50th Anniversary") rather than misspell them
+    if len(key) < TYPO_MIN_LENGTH or any(char.isdigit() for char in key):
+        return None
+    matches = {id(entry): entry for name, entry in OCCASION_INDEX.items() if is_typo(key, name)}
+    # A slip that could come from two occasions is not corrected to either
+    return next(iter(matches.values())) if len(matches) == 1 else None
+
+
+def lookup_occasion(occasion):
+    """
+    Resolves an occasion as typed by the storefront to its registry entry.
+
+    Case, punctuation, whitespace, aliases and single-slip misspellings of the whole name
+    ("birthday", "Mothers Day", "Chirstmas") all resolve to the canonical entry. Unknown
+    occasions get a generic entry built from the registry defaults with no
+    built-in spirit text. Callers keep the customer's own occasion text in prompts and
+    use the entry for its spirit and metadata.
+
+    Args:
+    occasion (str): The occasion for the message.
+
+    Returns:
+    dict: Entry with 'name', 'important_traits', 'trait_keys', 'spirit', 'greeting', 'keywords'
+    and 'prompt_variants'.
+    """
+    entry = _resolve_key(normalize_key(occasion))
+    if entry is not None:
+        return entry
+
+    name = " ".join(occasion.split()) if occasion else occasion
+    return {
+        'name': name,
+        'important_traits': DEFAULT_OCCASION['important_traits'],
+        'trait_keys': frozenset(normalize_key(t) for t in DEFAULT_OCCASION['important_traits']),
+        'spirit': None,
+        'greeting': f"Happy {name}",
+        'keywords': DEFAULT_OCCASION['keywords'],
+        'prompt_variants': DEFAULT_OCCASION['prompt_variants'],
+    }
+
+
+if __name__ == "__main__":
+    # Checks that misspellings resolve and that other occasions fall through to the generic entry
+    for typed, expected in (("Christmass", "Christmas"), ("Chirstmas", "Christmas"), ("Birthdya", "Birthday"),
+                            ("Thanksgiving Day", "Thanks Giving"), ("New Years", "New Year's"),
+                            ("Brothers Day", "Brothers Day"), ("Others Day", "Others Day"), ("Eastern", "Eastern"),
+                            ("Job Anniversary", "Job Anniversary"), ("Godmothers Day", "Godmothers Day"),
+                            ("Birthday 2", "Birthday 2")):
+        resolved = lookup_occasion(typed)['name']
+        assert resolved == expected, f"{typed!r} resolved to {resolved!r}, expected {expected!r}"
+    print("Occasion lookups OK")
@@ -0,0 +1,236 @@
+from string import Formatter
+import threading
+import logging
+import random
+import math
+
+
+# Rough characters per token, used to size the templates without a tokenizer
+CHARS_PER_TOKEN = 4
+
+# Static part of every greeting card prompt. It comes first and never varies per request,
+# so providers that cache prompt prefixes can reuse it across requests.
+SYSTEM_PROMPT = """You are a pro Geeting card text generator.
+
+You create greeting card messages for a person, considering their personality trait, your relationship with them, and the spirit of the event.
+The messages are tailored for events around Christmas, New Year's, Easter, and Thanksgiving to capture more of the spirit of the event versus concentrating on the person alone.
+
+Don't Forget:
+Each message should be clear, impactful, and appropriately themed, and capture the spirit of the event. Include new lines between lines, paragraphs, and stanzas.
+Answer in JSON, in the output format given in the request."""
+
+# Per-request part of the prompt
+USER_TEMPLATE = """
+    Create {style_count} of greeting card messages for a {relationship} on the occasion of {occasion}.
+
+    Spirit of the Event: {spirit_of_event}
+
+{instructions}
+
+
+    {length_rule}
+
+
+    Details:
+    Gender: {gender}
+    {relationship}'s Age: {age_years}
+
+
+    Output Format (in JSON):
+    {{
+{output_format}
+    }}
+    """
+
+# Opening of the prompt for each number of requested styles
+STYLE_COUNT_WORDS = {1: "one style", 2: "two styles", 3: "three styles", 4: "four styles"}
+
+# Instruction of each style; each style uses the trait and theme at its position in STYLES
+STYLE_INSTRUCTIONS = {
+    "Normal1Paragraph": 'Normal, 1 paragraph, themed "{theme}", including trait "{trait}" and capturing the spirit of {occasion}.',
+    "Normal2Paragraphs": 'Normal, 2 paragraphs, themed "{theme}", including trait "{trait}". Each paragraph should not exceed 20 words and should capture the essence of {occasion}.',
+    "ShortAndSweet": 'Short and sweet, themed "{theme}", with trait "{trait}" and reflecting the spirit of {occasion}.',
+    "Poem": 'Poem style, themed "{theme}", reflecting trait "{trait}" and the spirit of {occasion}. Comprise {poem_lines} lines. Max 12 words per stanza'
+}
+
+# Output format of each style
+STYLE_OUTPUT_FORMATS = {
+    "Normal1Paragraph": '"Normal1Paragraph": {{"Trait": "{trait}", "Theme": "{theme}", "Message": "<Message>"}}',
+    "Normal2Paragraphs": '"Normal2Paragraphs": {{"Trait": "{trait}", "Theme": "{theme}", "para1": "<paragraph 1>", "para2": "<paragraph 2>"}}',
+    "ShortAndSweet": '"ShortAndSweet": {{"Trait": "{trait}", "Theme": "{theme}", "Message": "<Message>"}}',
+    "Poem": '"Poem": {{"Trait": "{trait}", "Theme": "{theme}", {poem_format}}}'
+}
+
+# Prompt variants: they share the prompt text and differ in the number of poem lines.
+# The weight sets how often a variant is picked among the ones an occasion allows.
+PROMPT_VARIANTS = {
+    "prompt1": {"poem_lines": 4, "weight": 1.0},
+    "prompt2": {"poem_lines": 8, "weight": 1.0},
+}
+
+
+def estimate_tokens(text):
+    """
+    Returns the approximate token length of a text.
+    """
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def poem_format(poem_lines):
+    """
+    Returns the line keys of the poem output format, e.g. "line1": "<Opening line>", ... "line4": "<Closing line>".
+    """
+    placeholders = ["<Opening line>"] + [f"<line {i}>" for i in range(2, poem_lines)] + ["<Closing line>"]
+    return ", ".join(f'"line{i}": "{placeholder}"' for i, placeholder in enumerate(placeholders, 1))
+
+
+class CompiledTemplate:
+    """
+    A str.format template parsed once into its literal text and named fields, so rendering
+    is a single join instead of a parse per request.
+    """
+
+    def __init__(self, template):
+        """
+        Raises:
+        ValueError: If the template uses positional fields, conversions or format specs.
+        """
+        self.parts = []
+        self.fields = []
+        for literal, field, format_spec, conversion in Formatter().parse(template):
+            if literal:
+                self.parts.append((literal, None))
+            if field is None:
+                continue
+            if not field or field.isdigit() or format_spec or conversion:
+                raise ValueError(f"Unsupported template field '{{{field}}}' in prompt template.")
+            self.parts.append((None, field))
+            if field not in self.fields:
+                self.fields.append(field)
+        self.static_text = "".join(literal for literal, _ in self.parts if literal)
+
+    def render(self, **values):
+        return "".join(literal if field is None else str(values[field]) for literal, field in self.parts)
+
+
+class PromptTemplate:
+    """
+    One prompt variant: the static system prefix and the compiled per-request user message.
+    """
+
+    def __init__(self, name, poem_lines, weight=1.0, system=SYSTEM_PROMPT, user=USER_TEMPLATE):
+        self.name = name
+        self.poem_lines = poem_lines
+        self.weight = weight
+        self.system = system
+        self.user = CompiledTemplate(user)
+        self.prefix_tokens = estimate_tokens(system)
+        self.static_tokens = self.prefix_tokens + estimate_tokens(self.user.static_text)
+
+    def messages(self, **values):
+        """
+        Returns the system and user chat messages of a request, the static prefix first.
+        """
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.user.render(**values)}
+        ]
+
+
+class PromptRegistry:
+    """
+    Registry of the prompt variants, compiled once at import.
+
+    Variants are picked by weight with the request's random generator, so a seed
+    reproduces the choice. The registry counts renders per variant and the estimated
+    prompt tokens, split into the cacheable static prefix and the per-request rest.
+    """
+
+    def __init__(self, variants=PROMPT_VARIANTS, weights=None):
+        """
+        Args:
+        variants (dict): Variant name -> {"poem_lines", "weight"}.
+        weights (dict): Optional variant name -> weight, overriding the variants' own weights.
+        """
+        weights = weights or {}
+        self.templates = {
+            name: PromptTemplate(name, spec["poem_lines"], weights.get(name, spec.get("weight", 1.0)))
+            for name, spec in variants.items()
+        }
+        self.style_instructions = {style: CompiledTemplate(text) for style, text in STYLE_INSTRUCTIONS.items()}
+        self.style_output_formats = {style: CompiledTemplate(text) for style, text in STYLE_OUTPUT_FORMATS.items()}
+        self._lock = threading.Lock()
+        self.stats = {name: {"renders": 0, "prompt_tokens": 0} for name in self.templates}
+
+    def choose(self, names, rng=None):
+        """
+        Picks one of the given variants by weight.
+
+        Args:
+        names (list): Variants allowed for the request, e.g. an occasion's prompt_variants.
+        rng (random.Random): Optional generator, so a seed reproduces the choice.
+
+        Returns:
+        PromptTemplate: The chosen variant.
+        """
+        rng = rng or random
+        templates = [self.templates[name] for name in names if name in self.templates]
+        if not templates:
+            raise ValueError(f"None of the prompt variants {names} is registered.")
+        weights = [template.weight for template in templates]
+        if not any(weights):
+            weights = None
+        return rng.choices(templates, weights=weights)[0]
+
+    def render(self, template, **values):
+        """
+        Renders the chat messages of a variant and counts their estimated tokens.
+        """
+        messages = template.messages(**values)
+        with self._lock:
+            self.stats[template.name]["renders"] += 1
+            self.stats[template.name]["prompt_tokens"] += sum(estimate_tokens(m["content"]) for m in messages)
+        return messages
+
+    def snapshot(self):
+        """
+        Returns the weight, the static prefix and total static token estimates and the
+        render counters of every variant.
+        """
+        with self._lock:
+            return {
+                name: dict(
+                    weight=template.weight,
+                    poem_lines=template.poem_lines,
+                    variables=template.user.fields,
+                    prefix_tokens=template.prefix_tokens,
+                    static_tokens=template.static_tokens,
+                    renders=self.stats[name]["renders"],
+                    average_prompt_tokens=(self.stats[name]["prompt_tokens"] / self.stats[name]["renders"]
+                                           if self.stats[name]["renders"] else 0.0)
+                )
+                for name, template in self.templates.items()
+            }
+
+
+def parse_weights(value):
+    """
+    Parses "prompt1:2, prompt2:1" into {"prompt1": 2.0, "prompt2": 1.0}.
+
+    Malformed items and negative weights are skipped with a warning, leaving those
+    variants at their default weight.
+    """
+    weights = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition(':')
+        try:
+            weight = float(weight)
+        except ValueError:
+            weight = None
+        if not name.strip() or weight is None or not math.isfinite(weight) or weight < 0:
+            logging.warning(f"Ignoring malformed prompt weight: '{item.strip()}'")
+            continue
+        weights[name.strip()] = weight
+    return weights
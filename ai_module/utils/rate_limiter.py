@@ -0,0 +1,180 @@
+import threading
+import asyncio
+import time
+
+
+# Interval at which queued callers re-check for a free slot
+POLL_INTERVAL_SECONDS = 0.02
+
+
+class RateLimitExceeded(RuntimeError):
+    """
+    Raised when a call waited longer than the limiter's max_wait_seconds for capacity.
+    """
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at a per-minute rate, holding at most one minute's worth.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount):
+        """
+        Returns the seconds until `amount` tokens are available, 0 if they are now.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount):
+        """
+        Takes (positive) or returns (negative) tokens after the fact, e.g. once the real usage is known.
+        """
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class UpstreamLimiter:
+    """
+    Process-wide limiter in front of every upstream LLM request.
+
+    A request needs a concurrency slot, one token from the requests-per-minute bucket and
+    its estimated tokens from the tokens-per-minute bucket. Callers queue for up to
+    max_wait_seconds and then fail with RateLimitExceeded.
+
+    The concurrency limit adapts AIMD-style: it grows by one slot per limit's worth of
+    fast successful requests, and shrinks multiplicatively when a request is throttled
+    (HTTP 429) or slower than latency_target_seconds, at most once per latency_target_seconds.
+    """
+
+    def __init__(self, requests_per_minute=300, tokens_per_minute=200000, max_wait_seconds=10.0,
+                 min_concurrency=2, max_concurrency=20, latency_target_seconds=10.0, decrease_factor=0.7):
+        """
+        Args:
+        requests_per_minute (int): Sustained request rate.
+        tokens_per_minute (int): Sustained prompt + completion token rate.
+        max_wait_seconds (float): Longest time a request may queue for capacity.
+        min_concurrency (int): Lower bound of the adaptive concurrency limit.
+        max_concurrency (int): Upper bound, and starting value, of the adaptive concurrency limit.
+        latency_target_seconds (float): Requests slower than this count as a congestion signal.
+        decrease_factor (float): Factor the limit is multiplied by on congestion.
+        """
+        self.max_wait_seconds = max_wait_seconds
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target_seconds = latency_target_seconds
+        self.decrease_factor = decrease_factor
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.queued = 0
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"acquired": 0, "rejected": 0, "throttled": 0, "slow": 0, "increases": 0, "decreases": 0,
+                      "wait_seconds": 0.0}
+
+    def _try_acquire(self, tokens):
+        """
+        Takes a slot and the bucket tokens if all are available. Returns 0 on success,
+        otherwise the seconds to wait before trying again.
+        """
+        with self._lock:
+            if self.in_flight >= int(self.limit):
+                return POLL_INTERVAL_SECONDS
+            wait = max(self._requests.wait_time(1), self._tokens.wait_time(tokens))
+            if wait > 0:
+                return wait
+            self._requests.take(1)
+            self._tokens.take(tokens)
+            self.in_flight += 1
+            self.stats["acquired"] += 1
+            return 0.0
+
+    def _next_wait(self, tokens, started):
+        wait = self._try_acquire(tokens)
+        if wait == 0:
+            return None
+        remaining = started + self.max_wait_seconds - time.monotonic()
+        if remaining <= 0:
+            with self._lock:
+                self.stats["rejected"] += 1
+            raise RateLimitExceeded(f"No upstream capacity within {self.max_wait_seconds}s.")
+        return min(wait, remaining, 1.0)
+
+    async def acquire(self, tokens):
+        """
+        Waits for a slot and the rate budget of a request of about `tokens` tokens.
+
+        Raises:
+        RateLimitExceeded: If the capacity did not free up within max_wait_seconds.
+        """
+        with self._lock:
+            self.queued += 1
+        started = time.monotonic()
+        try:
+            while True:
+                wait = self._next_wait(tokens, started)
+                if wait is None:
+                    return
+                await asyncio.sleep(wait)
+        finally:
+            with self._lock:
+                self.queued -= 1
+                self.stats["wait_seconds"] += time.monotonic() - started
+
+    def release(self, latency, throttled=False, token_correction=0):
+        """
+        Frees the slot of a finished request and adapts the concurrency limit.
+
+        Args:
+        latency (float): Seconds the request took.
+        throttled (bool): True if the provider answered 429.
+        token_correction (int): Actual minus estimated tokens, settled against the token bucket.
+        """
+        with self._lock:
+            self.in_flight -= 1
+            if token_correction:
+                self._tokens.adjust(token_correction)
+            slow = latency >= self.latency_target_seconds
+            if throttled or slow:
+                self.stats["throttled" if throttled else "slow"] += 1
+                now = time.monotonic()
+                # Back off at most once per target latency, so one burst of slow responses counts once
+                if now - self._last_decrease >= self.latency_target_seconds:
+                    self.limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+                    self._last_decrease = now
+                    self.stats["decreases"] += 1
+            elif self.limit < self.max_concurrency:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                self.stats["increases"] += 1
+
+    def snapshot(self):
+        """
+        Returns the concurrency limit, in-flight and queued requests, bucket levels and counters.
+        """
+        with self._lock:
+            self._requests.wait_time(0)
+            self._tokens.wait_time(0)
+            return dict(
+                self.stats,
+                concurrency_limit=int(self.limit),
+                in_flight=self.in_flight,
+                queued=self.queued,
+                requests_available=int(self._requests.tokens),
+                tokens_available=int(self._tokens.tokens)
+            )
@@ -0,0 +1,155 @@
+import math
+import copy
+
+# Message styles in the order message_generator returns them
+STYLES = ("Normal1Paragraph", "Normal2Paragraphs", "ShortAndSweet", "Poem")
+
+# Minimum and maximum number of poem lines the prompts ask for; a valid poem has at least the minimum
+MIN_POEM_LINES = 4
+MAX_POEM_LINES = 8
+
+# Fields each style must contain as non-empty strings to be considered valid
+REQUIRED_FIELDS = {
+    "Normal1Paragraph": ("Message",),
+    "Normal2Paragraphs": ("para1", "para2"),
+    "ShortAndSweet": ("Message",),
+    "Poem": tuple(f"line{i}" for i in range(1, MIN_POEM_LINES + 1)),
+}
+
+# Default length budget of each style in words; the poem allows up to 8 lines of 12 words
+DEFAULT_WORD_BUDGETS = {"Normal1Paragraph": 40, "Normal2Paragraphs": 40, "ShortAndSweet": 40, "Poem": 96}
+
+# Completion tokens per budgeted word, with headroom for overshooting the budget, per style for
+# its keys, trait and theme, per poem line key, and per response; and the smallest cap sent
+TOKENS_PER_WORD = 2.0
+STYLE_OVERHEAD_TOKENS = 60
+POEM_LINE_OVERHEAD_TOKENS = 6
+RESPONSE_OVERHEAD_TOKENS = 20
+MIN_MAX_TOKENS = 256
+
+
+def _style_schema(style):
+    fields = ["Trait", "Theme"] + list(REQUIRED_FIELDS[style])
+    if style == "Poem":
+        fields += [f"line{i}" for i in range(len(REQUIRED_FIELDS[style]) + 1, MAX_POEM_LINES + 1)]
+    return {
+        "type": "object",
+        "properties": {field: {"type": "string"} for field in fields},
+        "required": list(REQUIRED_FIELDS[style]),
+    }
+
+
+# JSON schema of the full four-style response
+MESSAGES_SCHEMA = {
+    "type": "object",
+    "properties": {style: _style_schema(style) for style in STYLES},
+    "required": list(STYLES),
+}
+
+
+def build_messages_schema(styles=STYLES):
+    """
+    Returns the JSON schema of a response containing only the given styles.
+    """
+    schema = copy.deepcopy(MESSAGES_SCHEMA)
+    schema["properties"] = {style: schema["properties"][style] for style in styles}
+    schema["required"] = list(styles)
+    return schema
+
+
+def build_response_format(mode, styles=STYLES):
+    """
+    Returns the response_format argument for a structured-output mode.
+
+    Args:
+    mode (str): "json_schema", "json_object", or anything else for unconstrained output.
+    styles (tuple): Styles the response must contain.
+
+    Returns:
+    dict: The response_format to send, or None for unconstrained output.
+    """
+    if mode == "json_schema":
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": "greeting_card_messages", "schema": build_messages_schema(styles)}
+        }
+    if mode == "json_object":
+        return {"type": "json_object"}
+    return None
+
+
+def validate_styles(parsed_json, styles=STYLES):
+    """
+    Checks each style of a parsed response against the schema.
+
+    Args:
+    parsed_json (dict): Parsed response.
+    styles (tuple): Styles to check.
+
+    Returns:
+    dict: Style -> True if the style is present with all required fields as non-empty strings.
+    """
+    validity = {}
+    for style in styles:
+        value = parsed_json.get(style) if isinstance(parsed_json, dict) else None
+        validity[style] = isinstance(value, dict) and all(
+            isinstance(value.get(field), str) and value[field].strip() for field in REQUIRED_FIELDS[style]
+        )
+    return validity
+
+
+def normalize_styles(styles=None):
+    """
+    Validates a list of requested styles.
+
+    Args:
+    styles (list): Style names, or None for all of them.
+
+    Returns:
+    tuple: The requested styles without duplicates, in STYLES order.
+    """
+    if styles is None:
+        return STYLES
+    if isinstance(styles, str):
+        styles = [styles]
+    if not isinstance(styles, (list, tuple)) or not styles:
+        raise ValueError("styles must be a non-empty list.")
+    unknown = [style for style in styles if style not in STYLES]
+    if unknown:
+        raise ValueError(f"Unknown styles {unknown}; expected any of {list(STYLES)}.")
+    return tuple(style for style in STYLES if style in styles)
+
+
+def resolve_length_budget(styles, length_budget=None):
+    """
+    Returns the word budget of each requested style.
+
+    Args:
+    styles (tuple): Requested styles, as returned by normalize_styles.
+    length_budget (dict): Optional style -> maximum words, overriding DEFAULT_WORD_BUDGETS.
+
+    Returns:
+    dict: Style -> maximum words, for the requested styles only.
+    """
+    length_budget = length_budget or {}
+    if not isinstance(length_budget, dict):
+        raise ValueError("length_budget must be an object mapping styles to word counts.")
+    budget = {}
+    for style in styles:
+        words = length_budget.get(style, DEFAULT_WORD_BUDGETS[style])
+        if isinstance(words, bool) or not isinstance(words, int) or words <= 0:
+            raise ValueError(f"length_budget for '{style}' must be a positive integer.")
+        budget[style] = words
+    return budget
+
+
+def estimate_max_tokens(budget):
+    """
+    Returns the max_tokens that fits a response within the given word budgets, JSON wrapper included.
+    """
+    tokens = RESPONSE_OVERHEAD_TOKENS + sum(
+        STYLE_OVERHEAD_TOKENS + math.ceil(words * TOKENS_PER_WORD) for words in budget.values()
+    )
+    if "Poem" in budget:
+        tokens += MAX_POEM_LINES * POEM_LINE_OVERHEAD_TOKENS
+    return max(MIN_MAX_TOKENS, tokens)
@@ -0,0 +1,141 @@
+import numpy as np
+import threading
+import time
+import zlib
+
+from ai_module.utils.occasions import normalize_key
+
+
+# Relative weight of each kind of feature in the request vector
+FEATURE_WEIGHTS = {"trait": 1.0, "theme": 1.0, "ngram": 0.3, "age": 1.5}
+
+
+def age_bucket(age_years):
+    """
+    Maps an age to the coarse bucket used for similarity: child, teen, then decades.
+    """
+    if age_years < 13:
+        return "child"
+    if age_years < 20:
+        return "teen"
+    return f"{(age_years // 10) * 10}s"
+
+
+def request_features(character_traits, message_theme, age_years):
+    """
+    Returns the weighted features of a request: each trait and theme, their character
+    trigrams (so "kind" and "kindness" overlap), and the age bucket.
+
+    Returns:
+    dict: Feature string -> weight.
+    """
+    features = {}
+    for kind, values in (("trait", character_traits), ("theme", message_theme)):
+        for value in values:
+            key = normalize_key(value)
+            if not key:
+                continue
+            features[f"{kind}:{key}"] = FEATURE_WEIGHTS[kind]
+            padded = f"#{key}#"
+            for i in range(len(padded) - 2):
+                features[f"{kind}3:{padded[i:i + 3]}"] = FEATURE_WEIGHTS["ngram"]
+    features[f"age:{age_bucket(age_years)}"] = FEATURE_WEIGHTS["age"]
+    return features
+
+
+def hash_features(features, dim):
+    """
+    Projects weighted features onto a unit vector with the hashing trick.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, weight in features.items():
+        h = zlib.crc32(feature.encode("utf-8"))
+        # Use one hash bit as the sign to keep collisions unbiased
+        vector[h % dim] += weight if h & 0x80000000 else -weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticMessageCache:
+    """
+    Near-duplicate cache of generated message sets.
+
+    Requests are partitioned by occasion, relationship and gender, which must match
+    exactly. Within a partition, the hashed trait/theme/age vector of a new request is
+    compared by cosine similarity against the stored ones and the best match above
+    the threshold is reused.
+    """
+
+    def __init__(self, threshold=0.9, max_entries=2048, dim=1024):
+        """
+        Args:
+        threshold (float): Minimum cosine similarity for a stored message set to be reused.
+        max_entries (int): Capacity; the least recently used entry is evicted when full.
+        dim (int): Dimension of the hashed feature vectors.
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.dim = dim
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._groups = np.full(max_entries, -1, dtype=np.int64)
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._values = [None] * max_entries
+        self._group_ids = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def _group_key(occasion, relationship, gender):
+        return occasion, normalize_key(relationship), normalize_key(gender)
+
+    def lookup(self, occasion, relationship, gender, character_traits, message_theme, age_years):
+        """
+        Returns the most similar stored entry above the threshold, or None.
+
+        Returns:
+        tuple: (stored value, similarity) or None.
+        """
+        vector = hash_features(request_features(character_traits, message_theme, age_years), self.dim)
+        with self._lock:
+            self.stats["lookups"] += 1
+            # Only stores create groups; a request of an unseen group is a miss
+            group = self._group_ids.get(self._group_key(occasion, relationship, gender))
+            candidates = np.flatnonzero(self._groups[:self._size] == group) if group is not None else ()
+            if len(candidates):
+                scores = self._vectors[candidates] @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    index = candidates[best]
+                    self._last_used[index] = time.monotonic()
+                    self.stats["hits"] += 1
+                    return self._values[index], float(scores[best])
+            self.stats["misses"] += 1
+            return None
+
+    def add(self, occasion, relationship, gender, character_traits, message_theme, age_years, value):
+        """
+        Stores a generated value, evicting the least recently used entry when full.
+        """
+        vector = hash_features(request_features(character_traits, message_theme, age_years), self.dim)
+        with self._lock:
+            if self._size < self.max_entries:
+                index = self._size
+                self._size += 1
+            else:
+                index = int(np.argmin(self._last_used))
+                self.stats["evictions"] += 1
+            self._vectors[index] = vector
+            key = self._group_key(occasion, relationship, gender)
+            self._groups[index] = self._group_ids.setdefault(key, len(self._group_ids))
+            self._last_used[index] = time.monotonic()
+            self._values[index] = value
+
+    def snapshot(self):
+        """
+        Returns the counters, hit rate and current size.
+        """
+        with self._lock:
+            lookups = self.stats["lookups"]
+            return dict(self.stats, size=self._size, threshold=self.threshold,
+                        hit_rate=self.stats["hits"] / lookups if lookups else 0.0)
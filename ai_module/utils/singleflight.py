@@ -0,0 +1,69 @@
+import concurrent.futures
+import threading
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one.
+
+    The first caller of a key (the leader) runs the call; callers arriving while it is in
+    flight wait for, and receive, the leader's result or exception. The call runs as a task of
+    its own, so cancelling the leader does not fail the callers merged into it. Once the call
+    finishes the key is free again, so later callers start a new call.
+
+    The shared result is a thread-safe future, so callers on different event loops (the
+    ASGI server's loop and the background loop behind the sync wrappers) coalesce too.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "merged": 0}
+
+    async def do(self, key, fn):
+        """
+        Runs fn() unless a call with the same key is already in flight, and returns its result.
+
+        Args:
+        key: Hashable key of the call.
+        fn (callable): Coroutine function without arguments, run by the leader.
+
+        Returns:
+        The result of fn(), shared by every caller of the key.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self._calls[key] = future
+                self.stats["calls"] += 1
+            else:
+                self.stats["merged"] += 1
+
+        if not leader:
+            # Shielded, so a cancelled waiter does not cancel the result the others wait for
+            return await asyncio.shield(asyncio.wrap_future(future))
+
+        task = asyncio.ensure_future(fn())
+        task.add_done_callback(lambda done: self._finish(key, future, done))
+        # Shielded, so a cancelled leader leaves the call running for the others
+        return await asyncio.shield(task)
+
+    def _finish(self, key, future, task):
+        if task.cancelled():
+            future.set_exception(RuntimeError("The coalesced call was cancelled."))
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+        with self._lock:
+            del self._calls[key]
+
+    def snapshot(self):
+        """
+        Returns the number of calls run, the number of calls merged into them and the calls in flight.
+        """
+        with self._lock:
+            return dict(self.stats, in_flight=len(self._calls))
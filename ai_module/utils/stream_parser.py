@@ -0,0 +1,112 @@
+import logging
+import json
+
+from ai_module.utils.utils import extract_messages, extract_style_from_json, extract_from_regex
+from ai_module.utils.schemas import STYLES
+
+
+class StreamingMessageParser:
+    """
+    Incremental parser for the greeting card JSON as it arrives in a token stream.
+
+    Text before the first "{" (such as an opening ```json fence) is skipped. The parser
+    tracks strings, escapes and brace depth, and as soon as the object value of a
+    top-level style key closes, that style is parsed and emitted. A fragment that does
+    not parse as JSON falls back to regex extraction. finish() runs the regular
+    extract_messages cleanup over the whole response for any style not yet emitted.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.emitted = {}
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_key = None
+        self._value_start = None
+
+    def feed(self, text):
+        """
+        Adds streamed text and returns the styles completed by it.
+
+        Args:
+            text (str): The next chunk of the completion.
+
+        Returns:
+            list: (style, message) tuples, in the order they completed.
+        """
+        self.buffer += text
+        completed = []
+        buffer = self.buffer
+        for i in range(self._pos, len(buffer)):
+            char = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        # Remember the latest string at the top level; it is the key of the next value
+                        try:
+                            self._last_key = json.loads(buffer[self._string_start:i + 1])
+                        except ValueError:
+                            self._last_key = None
+                continue
+
+            if char == '"' and self._depth >= 1:
+                self._in_string = True
+                self._string_start = i
+            elif char == '{':
+                self._depth += 1
+                if self._depth == 2:
+                    self._value_start = i
+            elif char == '}' and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 1 and self._value_start is not None:
+                    style = self._last_key
+                    result = self._parse_fragment(style, buffer[self._value_start:i + 1])
+                    if result is not None:
+                        completed.append(result)
+                    self._value_start = None
+        self._pos = len(buffer)
+        return completed
+
+    def _parse_fragment(self, style, fragment):
+        if style not in STYLES or style in self.emitted:
+            return None
+        try:
+            message = extract_style_from_json({style: json.loads(fragment)}, style)
+        except ValueError:
+            logging.warning(f"Streamed '{style}' is not valid JSON. Attempting regex extraction.")
+            message = extract_from_regex(f'"{style}": {fragment}')[STYLES.index(style)]
+        if not message:
+            return None
+        self.emitted[style] = message
+        return style, message
+
+    def finish(self):
+        """
+        Flushes the parser at the end of the stream.
+
+        Returns:
+            list: (style, message) tuples for the styles that were not emitted while streaming.
+        """
+        remaining = [style for style in STYLES if style not in self.emitted]
+        if not remaining:
+            return []
+        extracted = dict(zip(STYLES, extract_messages(self.buffer)))
+        completed = []
+        for style in remaining:
+            self.emitted[style] = extracted[style]
+            completed.append((style, extracted[style]))
+        return completed
+
+    def messages(self):
+        """
+        Returns the four messages parsed so far, in message_generator order.
+        """
+        return tuple(self.emitted.get(style, "") for style in STYLES)
@@ -0,0 +1,118 @@
+import random
+import time
+import sys
+
+
+def wrap_words(words, max_width, measure, kerning=None):
+    """
+    Greedy word wrap that measures every distinct word and the space once and wraps by
+    adding up widths, so a paragraph is wrapped in linear time.
+
+    A line's width is the sum of its pieces plus the kerning at the joins: with kerning
+    given, the joins are adjusted with it and no line is measured again. Without it the
+    joins are unknown, e.g. under a shaping layout engine, and each candidate line is
+    measured whole, as the width check needs it exact.
+
+    Args:
+    words (list): Words of the paragraph, without spaces.
+    max_width (float): Widest a line may be; a single wider word gets a line of its own.
+    measure (callable): Returns the width of a text.
+    kerning (callable): Optional, returns the kerning between two characters.
+
+    Returns:
+    tuple: The lines and their widths.
+    """
+    space = measure(' ')
+    word_widths = {}
+    lines, widths = [], []
+    line, line_width = [], 0
+    for word in words:
+        width = word_widths.get(word)
+        if width is None:
+            width = word_widths[word] = measure(word)
+        if not line:
+            line, line_width = [word], width
+            continue
+        if kerning is not None:
+            joined_width = line_width + space + width + kerning(line[-1][-1], ' ') + kerning(' ', word[0])
+        else:
+            joined_width = measure(' '.join(line) + ' ' + word)
+        if joined_width <= max_width:
+            line.append(word)
+            line_width = joined_width
+        else:
+            lines.append(' '.join(line))
+            widths.append(line_width)
+            line, line_width = [word], width
+    if line:
+        lines.append(' '.join(line))
+        widths.append(line_width)
+    return lines, widths
+
+
+def wrap_words_remeasuring(words, max_width, measure):
+    """
+    The former wrap, measuring the whole growing line again for every word. Kept as the
+    benchmark's baseline.
+    """
+    lines = []
+    current_line = []
+    for word in words:
+        test_line = ' '.join(current_line + [word])
+        if measure(test_line) <= max_width:
+            current_line.append(word)
+        else:
+            if current_line:
+                lines.append(' '.join(current_line))
+            current_line = [word]
+    if current_line:
+        lines.append(' '.join(current_line))
+    return lines
+
+
+def benchmark_word_wrap(font_path, paragraph_words=(20, 40, 80, 160, 320, 640), size=120, max_width=1200,
+                        repeats=5, seed=0, use_table=True):
+    """
+    Times both wraps on Normal2Paragraphs-like bodies of growing length, at one font size of
+    the letter's size search, measuring with the font's glyph metrics table or with FreeType.
+
+    Returns:
+    list: One dict per body length with the word count, both timings in milliseconds and
+    whether the two wraps agree.
+    """
+    from ai_module.utils.letter_layout import get_text_measurer
+
+    rng = random.Random(seed)
+    vocabulary = ("wishing you a season of warmth and joy with family friends laughter light hope "
+                  "peace kindness gratitude celebrate together memories blessings cheer bright "
+                  "wonderful happiness love grateful holiday festive generous").split()
+    measure, kerning = get_text_measurer(size, font_path, use_table)
+    results = []
+    for count in paragraph_words:
+        # The paragraphs of a Normal2Paragraphs body are wrapped as one run of words
+        words = [rng.choice(vocabulary) for _ in range(count)]
+        timings = {}
+        outputs = {}
+        for name, wrap in (("remeasuring", lambda: wrap_words_remeasuring(words, max_width, measure)),
+                           ("linear", lambda: wrap_words(words, max_width, measure, kerning)[0])):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                outputs[name] = wrap()
+            timings[name] = (time.perf_counter() - start) / repeats * 1000
+        results.append({
+            "words": count,
+            "remeasuring_ms": round(timings["remeasuring"], 3),
+            "linear_ms": round(timings["linear"], 3),
+            "same_lines": outputs["remeasuring"] == outputs["linear"]
+        })
+    return results
+
+
+if __name__ == "__main__":
+    # Prints the benchmark for the font given on the command line, the letter font by default
+    font = sys.argv[1] if len(sys.argv) > 1 else "wilson-p4chbsdco3fw3f363hr4acd9fr (1).ttf"
+    for use_table in (True, False):
+        print("Glyph metrics table:" if use_table else "FreeType:")
+        for row in benchmark_word_wrap(font, use_table=use_table):
+            print(f"{row['words']:>5} words: remeasuring {row['remeasuring_ms']:>9.3f}ms, "
+                  f"linear {row['linear_ms']:>7.3f}ms, same lines: {row['same_lines']}")
@@ -1,37 +1,55 @@
 from datetime import datetime
-from openai import OpenAI
-import configparser
 import random
 import json
 import os
-from openai import OpenAI
 import logging
 import os
 import re
 
+from ai_module.utils.helpers import load_config
+from ai_module.utils.llm_client import chat_completion_async, run_sync
+from ai_module.utils.occasion_cache import OccasionSpiritCache
+from ai_module.utils.singleflight import SingleFlight
+from ai_module.utils.occasions import lookup_occasion, normalize_key
+from ai_module.utils.schemas import STYLES, validate_styles
 
-def load_config():
-    """
-    Loads and returns the configuration from the config.ini file in the project root directory.
-    """
-    # Get the directory of the current script
-    script_dir = os.path.dirname(os.path.abspath(__file__))
 
-    # Go up two levels to the project root
-    project_root = os.path.dirname(os.path.dirname(script_dir))
+# Load configuration
+config = load_config()
 
-    # Construct the path to the config.ini file
-    config_file_path = os.path.join(project_root, 'config.ini')
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-    # Initialize and read the config parser
-    config = configparser.ConfigParser()
-    config.read(config_file_path)
+# Generated descriptions of occasions that are not built in, persisted across restarts
+spirit_cache = OccasionSpiritCache(
+    path=os.path.join(project_root, config.get('OCCASIONS', 'spirit_cache_path', fallback='occasion_spirits.json')),
+    max_entries=config.getint('OCCASIONS', 'spirit_cache_size', fallback=256),
+    ttl_seconds=config.getint('OCCASIONS', 'spirit_cache_ttl_seconds', fallback=30 * 24 * 3600)
+)
 
-    return config
+# Concurrent lookups of the same uncached occasion share one LLM call
+SPIRIT_COALESCING_ENABLED = config.getboolean('COALESCING', 'occasion_spirits', fallback=True)
+spirit_flight = SingleFlight()
 
-# Load configuration
-config = load_config()
 
+def clean_json_input(s):
+    """
+    Cleans the input string by removing markdown code block delimiters
+    and any leading/trailing irrelevant characters.
+
+    Args:
+        s (str): The raw input string.
+
+    Returns:
+        str: Cleaned JSON string.
+    """
+    s = s.strip()
+    
+    # Regex pattern to match code blocks with optional language specifier
+    code_block_pattern = re.compile(r'^```(?:\w+)?\n?(.*?)```$', re.DOTALL)
+    match = code_block_pattern.match(s)
+    if match:
+        return match.group(1).strip()
+    return s
 
 
 def extract_messages(greeting_card_message):
@@ -52,47 +70,51 @@ def extract_messages(greeting_card_message):
             - f_ShortAndSweet
             - f_poem
     """
-    # Initialize default messages
-    f_Normal1Paragraph = ""
-    f_Normal2Paragraphs = ""
-    f_ShortAndSweet = ""
-    f_poem = ""
+    (f_Normal1Paragraph, f_Normal2Paragraphs, f_ShortAndSweet, f_poem), _, _ = \
+        extract_messages_with_validity(greeting_card_message)
 
-    # Preprocess the input to remove code block markers and irrelevant characters
-    def clean_json_input(s):
-        """
-        Cleans the input string by removing markdown code block delimiters
-        and any leading/trailing irrelevant characters.
+    return f_Normal1Paragraph, f_Normal2Paragraphs, f_ShortAndSweet, f_poem
 
-        Args:
-            s (str): The raw input string.
 
-        Returns:
-            str: Cleaned JSON string.
-        """
-        s = s.strip()
-        
-        # Regex pattern to match code blocks with optional language specifier
-        code_block_pattern = re.compile(r'^```(?:\w+)?\n?(.*?)```$', re.DOTALL)
-        match = code_block_pattern.match(s)
-        if match:
-            return match.group(1).strip()
-        return s
+def extract_messages_with_validity(greeting_card_message, styles=STYLES):
+    """
+    Extracts the messages like extract_messages, and reports which styles came out valid.
 
+    A style parsed from JSON is valid when it has all its required fields as non-empty
+    strings. When the response is not a JSON object and regex extraction is used instead,
+    a style is valid when its message could be extracted.
+
+    Args:
+        greeting_card_message (str): JSON string containing greeting card messages.
+        styles (tuple): Styles to report on.
+
+    Returns:
+        tuple: (the four messages, dict of style -> True if valid, the parsed JSON object or
+            None if the response did not parse as one)
+    """
     cleaned_message = clean_json_input(greeting_card_message)
 
     # Attempt to parse JSON
     try:
         parsed_json = json.loads(cleaned_message)
-        logging.info("JSON parsing succeeded.")
-        # Proceed to extract messages as before
-        f_Normal1Paragraph, f_Normal2Paragraphs, f_ShortAndSweet, f_poem = extract_from_json(parsed_json)
     except json.JSONDecodeError:
+        parsed_json = None
+
+    if isinstance(parsed_json, dict):
+        logging.info("JSON parsing succeeded.")
+        messages = extract_from_json(parsed_json)
+        validity = validate_styles(parsed_json, styles)
+    else:
         logging.warning("JSON parsing failed. Attempting regex extraction.")
         # Fallback to regex extraction
-        f_Normal1Paragraph, f_Normal2Paragraphs, f_ShortAndSweet, f_poem = extract_from_regex(cleaned_message)
-    
-    return f_Normal1Paragraph, f_Normal2Paragraphs, f_ShortAndSweet, f_poem
+        parsed_json = None
+        messages = extract_from_regex(cleaned_message)
+        validity = {style: bool(messages[STYLES.index(style)]) for style in styles}
+
+    invalid = [style for style, valid in validity.items() if not valid]
+    if invalid:
+        logging.warning(f"Missing or invalid styles in the response: {invalid}")
+    return messages, validity, parsed_json
 
 
 def extract_from_json(parsed_json):
@@ -105,62 +127,61 @@ def extract_from_json(parsed_json):
     Returns:
         tuple: Extracted message strings.
     """
-    f_Normal1Paragraph = ""
-    f_Normal2Paragraphs = ""
-    f_ShortAndSweet = ""
-    f_poem = ""
+    f_Normal1Paragraph = extract_style_from_json(parsed_json, "Normal1Paragraph")
+    f_Normal2Paragraphs = extract_style_from_json(parsed_json, "Normal2Paragraphs")
+    f_ShortAndSweet = extract_style_from_json(parsed_json, "ShortAndSweet")
+    f_poem = extract_style_from_json(parsed_json, "Poem")
 
-    # Extract Normal1Paragraph
-    normal1Paragraph = parsed_json.get("Normal1Paragraph", {})
-    if isinstance(normal1Paragraph, dict):
-        f_Normal1Paragraph = normal1Paragraph.get('Message', "")
-        if not f_Normal1Paragraph:
-            logging.warning("'Normal1Paragraph' message is missing.")
-    else:
-        logging.warning("'Normal1Paragraph' should be a dictionary.")
+    return f_Normal1Paragraph, f_Normal2Paragraphs, f_ShortAndSweet, f_poem
 
-    # Extract Normal2Paragraphs
-    normal2Paragraphs = parsed_json.get("Normal2Paragraphs", {})
-    if isinstance(normal2Paragraphs, dict):
-        para1 = normal2Paragraphs.get('para1', "")
-        para2 = normal2Paragraphs.get('para2', "")
+
+def extract_style_from_json(parsed_json, style):
+    """
+    Extracts the message of a single style from a parsed JSON object.
+
+    Args:
+        parsed_json (dict): Parsed JSON data.
+        style (str): One of "Normal1Paragraph", "Normal2Paragraphs", "ShortAndSweet" or "Poem".
+
+    Returns:
+        str: The extracted message, or an empty string if it is missing or malformed.
+    """
+    message = ""
+    value = parsed_json.get(style, {})
+    if not isinstance(value, dict):
+        logging.warning(f"'{style}' should be a dictionary.")
+        return message
+
+    if style in ("Normal1Paragraph", "ShortAndSweet"):
+        message = value.get('Message', "")
+        if not message:
+            logging.warning(f"'{style}' message is missing.")
+
+    elif style == "Normal2Paragraphs":
+        para1 = value.get('para1', "")
+        para2 = value.get('para2', "")
         if para1 or para2:
-            f_Normal2Paragraphs = f"{para1}\n\n{para2}".strip()
+            message = f"{para1}\n\n{para2}".strip()
         else:
             logging.warning("'Normal2Paragraphs' messages are missing.")
-    else:
-        logging.warning("'Normal2Paragraphs' should be a dictionary.")
-
-    # Extract ShortAndSweet
-    shortAndSweet = parsed_json.get("ShortAndSweet", {})
-    if isinstance(shortAndSweet, dict):
-        f_ShortAndSweet = shortAndSweet.get('Message', "")
-        if not f_ShortAndSweet:
-            logging.warning("'ShortAndSweet' message is missing.")
-    else:
-        logging.warning("'ShortAndSweet' should be a dictionary.")
 
-    # Extract Poem
-    poem = parsed_json.get("Poem", {})
-    if isinstance(poem, dict):
+    elif style == "Poem":
         poem_lines = []
         # Assuming lines from line1 to line12
         for i in range(1, 13):
             line_key = f'line{i}'
-            line = poem.get(line_key, "").rstrip('.,')
+            line = value.get(line_key, "").rstrip('.,')
             if line:
                 poem_lines.append(line)
                 # Insert a blank line after the 4th line if more lines exist
-                if i == 4 and any(poem.get(f'line{j}', "") for j in range(5, 13)):
+                if i == 4 and any(value.get(f'line{j}', "") for j in range(5, 13)):
                     poem_lines.append("")
         if poem_lines:
-            f_poem = '\n'.join(poem_lines)
+            message = '\n'.join(poem_lines)
         else:
             logging.warning("'Poem' lines are missing.")
-    else:
-        logging.warning("'Poem' should be a dictionary.")
 
-    return f_Normal1Paragraph, f_Normal2Paragraphs, f_ShortAndSweet, f_poem
+    return message
 
 
 def extract_from_regex(text):
@@ -228,13 +249,80 @@ def extract_from_regex(text):
     return f_Normal1Paragraph, f_Normal2Paragraphs, f_ShortAndSweet, f_poem
 
 
-def select_random_traits(important_traits, character_traits, number=4):
+def ordinal(number):
+    """
+    Returns the English ordinal of a number, e.g. 1 -> "1st", 12 -> "12th", 23 -> "23rd".
+    """
+    if 10 <= number % 100 <= 20:
+        suffix = "th"
+    else:
+        suffix = {1: "st", 2: "nd", 3: "rd"}.get(number % 10, "th")
+    return f"{number}{suffix}"
+
+
+def name_is_personalizable(messages, name):
+    """
+    Checks that every mention of a name in a message set is the name itself, so the set can
+    be personalized for another recipient. Names that are also ordinary words (Hope, Joy,
+    Grace) fail once the word appears in another case ("full of joy") or starts a sentence
+    that carries on in lowercase ("Hope you have...").
+
+    Args:
+    messages (tuple): Message strings.
+    name (str): Name the messages were generated for.
+
+    Returns:
+    bool: True if the name mentions can be replaced safely.
+    """
+    if not name:
+        return False
+    pattern = re.compile(rf'(^|[.!?]\s+)?\b({re.escape(name)})\b(?=(\s+(?-i:[a-z]))?)', re.IGNORECASE | re.MULTILINE)
+    for message in messages:
+        for match in pattern.finditer(message):
+            starts_sentence = match.group(1) is not None
+            if match.group(2) != name or (starts_sentence and match.group(3)):
+                return False
+    return True
+
+
+def personalize_messages(messages, old_name, new_name, old_age, new_age):
+    """
+    Rewrites a message set generated for one recipient so it fits another, replacing
+    the name and age mentions ("24th", "24 years", "24-year"). Only sets that pass
+    name_is_personalizable for old_name can be rewritten.
+
+    Args:
+    messages (tuple): Message strings.
+    old_name (str): Name the messages were generated for.
+    new_name (str): Name of the new recipient.
+    old_age (int): Age the messages were generated for.
+    new_age (int): Age of the new recipient.
+
+    Returns:
+    tuple: Personalized message strings.
+    """
+    def personalize(text):
+        if old_name and new_name and old_name != new_name:
+            text = re.sub(rf'\b{re.escape(old_name)}\b', new_name, text)
+        if old_age is not None and new_age is not None and old_age != new_age:
+            text = re.sub(rf'\b{old_age}(?:st|nd|rd|th)\b', ordinal(new_age), text)
+            text = re.sub(rf'\b{old_age}(?=[\s-]*years?\b)', str(new_age), text)
+        return text
+
+    return tuple(personalize(message) for message in messages)
+
+
+def select_random_traits(important_traits, character_traits, number=4, rng=None):
+    # rng is an optional random.Random so a seed reproduces the selection; defaults to the global generator
+    rng = rng or random
+
     # Check if the list is empty or not provided
     if not important_traits or not character_traits:
         return ["Just focus on the occasion."]
     
-    # Filter traits that are relevant to the occasion
-    relevant_traits = [trait for trait in character_traits if trait in important_traits]
+    # Filter traits that are relevant to the occasion, ignoring case and punctuation
+    important_keys = {normalize_key(trait) for trait in important_traits}
+    relevant_traits = [trait for trait in character_traits if normalize_key(trait) in important_keys]
     
     # For a 50/50 split, simply balance the number of important trait entries with occasion focus entries
     if relevant_traits:
@@ -247,12 +335,12 @@ def select_random_traits(important_traits, character_traits, number=4):
             num_important_traits = len(relevant_traits)
             num_occasion_focus = number - num_important_traits
         
-        weighted_important_traits = random.sample(relevant_traits, num_important_traits)
+        weighted_important_traits = rng.sample(relevant_traits, num_important_traits)
         occasion_focus_entries = ["Just focus on the spirit of the occasion."] * num_occasion_focus
         
         # Combine and shuffle to avoid predictable ordering
         weighted_traits = weighted_important_traits + occasion_focus_entries
-        random.shuffle(weighted_traits)
+        rng.shuffle(weighted_traits)
     else:
         # If no relevant traits, fill with occasion focus
         weighted_traits = ["Just focus on the spirit of the occasion."] * number
@@ -261,7 +349,7 @@ def select_random_traits(important_traits, character_traits, number=4):
     selected = weighted_traits[:number]
     
     # Ensure at least one selection is focused on the spirit of the occasion if all traits were chosen
-    if all(trait in important_traits for trait in selected):
+    if all(normalize_key(trait) in important_keys for trait in selected):
         if len(selected) > 1 and "Just focus on the spirit of the occasion." not in important_traits:
             selected[-1] = "Just focus on the spirit of the occasion."
         elif len(selected) == 1:
@@ -270,27 +358,29 @@ def select_random_traits(important_traits, character_traits, number=4):
     return selected
 
 
-def select_random_themes(themes, number=4):
+def select_random_themes(themes, number=4, rng=None):
     """
     Selects a specified number of themes randomly from a list of themes. Themes can be repeated if the list is shorter than the required number.
     :param themes: A list of themes.
     :param number: The number of themes to select.
+    :param rng: Optional random.Random instance so a seed reproduces the selection. Defaults to the global generator.
     :return: A list of themes selected randomly, with possible repetitions.
     """
-    return [random.choice(themes) for _ in range(number)] if themes else None
+    rng = rng or random
+    return [rng.choice(themes) for _ in range(number)] if themes else None
 
 
 def gpt_core_of_occasion(occasion):
+    """
+    Synchronous wrapper around gpt_core_of_occasion_async.
+    """
+    return run_sync(gpt_core_of_occasion_async(occasion))
+
+
+async def gpt_core_of_occasion_async(occasion):
     logging.info("Generating GPT response of core of occasion...")
     logging.info(f"Occasion: {occasion}")
 
-    # Create OpenAI client
-    logging.info("Creating OpenAI client...")
-    # client = OpenAI()
-    client = OpenAI(
-        api_key=config['OPENAI']['GOOGLE_API_KEY'],
-        base_url="https://generativelanguage.googleapis.com/v1beta/openai/"
-    )
     prompt = """
     If I were an alien and I didn't know anything about {occasion}, in 4 bullet points explain to be me what
     the main spirit of the holiday is about
@@ -304,77 +394,78 @@ def gpt_core_of_occasion(occasion):
     logging.info(prompt)
     
     logging.info("Calling OpenAI API...")
-    completion = client.chat.completions.create(
-    # model="gpt-3.5-turbo",
-    model="gemini-1.5-flash",
+    completion = await chat_completion_async(
     messages=[
         {"role": "system", "content": "You are a curious alien who wants to learn about the holiday."},
         {"role": "user", "content": prompt}
-    ]
+    ],
+    usage={"purpose": "occasion_spirit", "occasion": occasion}
     )
 
     return completion.choices[0].message.content
 
 
 def get_core_of_the_event(occasion):
-    occasion_descriptions = {
-        "Christmas": """
-        Christmas is a celebration that commemorates the birth of Jesus Christ, highlighting joy and significance in Christianity. It involves the tradition of exchanging gifts to symbolize love, generosity, and goodwill. The holiday also emphasizes family togetherness, encouraging quality time, shared meals, and memory-making among loved ones. Characterized by a festive atmosphere, Christmas features decorations, lights, and music, fostering a sense of merriment and engaging people in activities to spread cheer.
-        """,
-
-        "Easter": """
-        Easter celebrates the resurrection of Jesus Christ, symbolizing hope, renewal, and the victory of good over evil, while prompting reflection on spiritual matters. The holiday is marked by fertility symbols like eggs and bunnies, representing life's cycle and new beginnings. Similar to Christmas, it's a time for family gatherings, special meals, and appreciating familial bonds. Easter also includes religious observances, with many attending church services to honor the resurrection's significance in Christian faith.
-        """,
-
-        "Mother's Day": """
-        Mother's Day is dedicated to honoring mothers and maternal figures, acknowledging their love, sacrifices, and contributions to family life. It's a day marked by gift-giving, cards, and gestures of affection, aiming to make mothers feel appreciated and cherished. Spending quality time together, through meals, outings, or simply enjoying each other's company, is essential, focusing on creating meaningful experiences. The day serves as an opportunity to express gratitude and love, thanking mothers for their pivotal role in shaping lives.
-        """,
-
-        "Father's Day": """
-        Father's Day is dedicated to celebrating fathers and paternal figures, recognizing their contributions to families and society. It mirrors Mother's Day in expressing gratitude, love, and appreciation with gifts, cards, and thoughtful gestures. The day encourages engaging in activities fathers enjoy, like outdoor adventures, hobbies, or special meals, aiming to make them feel valued. It highlights the significance of quality time and bonding, strengthening family connections.
-        """,
-
-        "Valentines": """
-        Valentine's Day is dedicated to expressing love and affection, celebrating not just romantic love but also the love for friends and family. It's marked by romantic gestures, with couples exchanging cards, flowers, and gifts, and enjoying romantic dinners or special outings. The day encourages acts of kindness, prompting people to show appreciation and affection for their loved ones. Serving as a thoughtful reminder, Valentine's Day underscores the importance of cherishing relationships that bring joy and fulfillment, offering a chance to openly express feelings and strengthen emotional connections.
-        """,
-        
-        "New Year's": """
-        New Year's symbolizes a fresh start and the opportunity for renewal, both personally and collectively, marked by goal setting and resolutions. New Year's Eve is celebrated with parties, fireworks, and festivities, emphasizing joyous gatherings and the countdown to a new beginning. It's a time for reflection on the past year, acknowledging achievements, learning from challenges, and expressing gratitude. The transition embodies hope and anticipation for the future, looking forward to the possibilities and opportunities the new year may present.
-        """,
+    """
+    Synchronous wrapper around get_core_of_the_event_async.
+    """
+    return run_sync(get_core_of_the_event_async(occasion))
 
-        "Thanks Giving": """
-        Thanksgiving revolves around expressing gratitude and reflecting on life's blessings and abundance. It fosters appreciation for positive aspects and relationships. The holiday is characterized by special meals, often featuring turkey, shared among family and friends, symbolizing unity and the significance of communal bonds. Acts of kindness, such as volunteering or supporting charities, are common, highlighting the spirit of giving back and expressing thankfulness. Emphasizing family bonding, Thanksgiving is a time for reinforcing familial ties and creating lasting memories through shared experiences.
-        """,
 
-        "Anniversary": """
-        A wedding anniversary celebrates a couple's union in marriage, marking their commitment, love, and partnership. It's an occasion for reflection on the couple's shared journey, including significant moments, challenges overcome, and the growth of their relationship. The celebration often features romantic gestures like exchanging gifts, special outings, or writing heartfelt messages to express love and appreciation. Additionally, some couples opt to renew their vows, reaffirming their commitment in a meaningful ceremony.
-        """,
+async def get_core_of_the_event_async(occasion):
+    """
+    Returns the "spirit of the event" description for an occasion.
 
-        "Birthday": """
-        A birthday is a celebration of a person's birth, marking the passage of another year of life. It's an occasion for reflection on the individual's growth, achievements, and the love and support they have received from family and friends. The celebration often includes special meals, gifts, and activities that make the individual feel valued and celebrated. It's a time to look back on the past year and look forward to the year ahead, with gratitude for the blessings and opportunities that have come their way.
-        """
-    }
-    
-    # Check if the occasion is in the dictionary; if not, call a generic function
-    return occasion_descriptions.get(occasion, gpt_core_of_occasion(occasion))
+    Occasions in the registry (including aliases, case variants and close misspellings)
+    are answered without any network call. Unknown occasions are looked up in the
+    persistent spirit cache and only generated with the LLM on a miss. Concurrent misses
+    of the same occasion share one generation.
+
+    Args:
+    occasion (str): The occasion for the message.
+
+    Returns:
+    str: The description of the occasion's spirit.
+    """
+    occasion_info = lookup_occasion(occasion)
+    if occasion_info['spirit']:
+        spirit_cache.record_builtin_hit()
+        return occasion_info['spirit']
+
+    occasion = occasion_info['name']
+    description = spirit_cache.get(occasion)
+    if description is not None:
+        return description
+
+    async def generate():
+        logging.info(f"No cached spirit for '{occasion}', generating it...")
+        description = await gpt_core_of_occasion_async(occasion)
+        await spirit_cache.set_async(occasion, description)
+        return description
+
+    if not SPIRIT_COALESCING_ENABLED:
+        return await generate()
+    return await spirit_flight.do(normalize_key(occasion), generate)
+
+
+def warm_up_occasion_spirits(occasions):
+    """
+    Pre-populates the spirit cache for the given occasions so the first request
+    for each of them does not pay the LLM round-trip.
+
+    Args:
+    occasions (list): Occasion names to warm up.
+    """
+    for occasion in occasions:
+        try:
+            get_core_of_the_event(occasion)
+        except Exception as e:
+            logging.error(f"Failed to warm up spirit for '{occasion}': {e}")
+    logging.info(f"Occasion spirit warm-up finished: {spirit_cache.snapshot()}")
 
 
 def get_important_traits(occasion):
-    if occasion == "Christmas":
-        return ["Kind", "Loving", "Generous", "Compassionate"]
-    elif occasion == "Easter":
-        return ["Kind", "Loving", "Generous", "Compassionate"]
-    elif occasion == "Mother's Day":
-        return ["Kind", "Loving", "Generous", "Compassionate", "Wise"]
-    elif occasion == "Father's Day":
-        return ["Kind", "Loving", "Generous", "Compassionate", "Wise"]
-    elif occasion == "New Year's":
-        return ["Adventurous", "Loving", "Generous", "Creative"]
-    elif occasion == "Valentines":
-        return ["Kind", "Loving", "Compassionate", "Patient", "Gentle"]
-    elif occasion == "Thanks Giving":
-        return ["Kind", "Loving", "Generous", "Compassionate"]
-    elif occasion == "Anniversary":
-        return ["Kind", "Loving", "Generous", "Compassionate", "Gentle", "Patient", "Adventurous"]
-    else:
-        return ["Kind", "Loving", "Wise", "Honest", "Generous", "Humorous", "Compassionate", "Patient", "Adventurous", "Gentle", "Loyal", "Caring", "Creative"]
\ No newline at end of file
+    """
+    Returns the character traits that matter most for an occasion, from the occasion registry.
+    """
+    return lookup_occasion(occasion)['important_traits']
@@ -2,15 +2,19 @@ from ai_module.utils.utils import load_config
 import boto3
 from botocore.exceptions import NoCredentialsError
 import uuid
-from ai_module.utils.letter_generator import create_letter_png_with_blank_page, concatenate_images
+from ai_module.utils.letter_generator import create_letter_png_with_blank_page, concatenate_images, mm_to_pixels
 from reportlab.pdfgen import canvas
 from ai_module.utils.letter_generator import create_letter_png
+from ai_module.utils.letter_layout import layout_letter, render_layout_pdf
 import logging
 import os
 
 
 config = load_config()
 
+# How the letter page of the card PDF is drawn: "vector" text in the embedded letter font, or a "raster" PNG
+CARD_PDF_LETTER_TEXT = config.get('CARD', 'pdf_letter_text', fallback='vector').strip().lower()
+
 def upload_to_aws(local_file, bucket_name, s3_file_prefix="generated-cards/"):
     """
     Function to upload a file to an S3 bucket with a unique S3 object name, inside a specified folder,
@@ -148,6 +152,52 @@ def pngs_to_pdf(png1_path, png2_path, output_pdf="output.pdf", width_mm=127 * 2,
           f"({width_mm}mm x {height_mm}mm)")
     return output_pdf
 
+def letter_to_pdf(png1_path, greeting, body, signoff, output_pdf="output.pdf", width_mm=127 * 2, height_mm=177.8, dpi=300):
+    """
+    Combine a PNG image and the letter into a two-page PDF, drawing the letter as vector text
+    in the embedded letter font rather than as an image. The letter is laid out as on the
+    right half of create_letter_png_with_blank_page, so both pages match pngs_to_pdf.
+    
+    :param png1_path: Path to the first PNG image (Page 1, e.g., last page and thumbnail)
+    :param greeting: The greeting text for the card.
+    :param body: The body text for the card.
+    :param signoff: The signoff text for the card.
+    :param output_pdf: Path to save the output PDF
+    :param width_mm: Width of each page in millimeters
+    :param height_mm: Height of each page in millimeters
+    :param dpi: Resolution the letter is laid out at, as for the PNG letter
+    """
+    # Convert dimensions from mm to points (1 mm = 2.83464567 points)
+    width_pt = width_mm * 2.83464567
+    height_pt = height_mm * 2.83464567
+    
+    if not os.path.exists(png1_path):
+        logging.error(f"Error: {png1_path} does not exist")
+        return None
+    
+    # Lay out the letter on the right half of the page, in pixels at the given DPI
+    width_px = mm_to_pixels(width_mm, dpi)
+    height_px = mm_to_pixels(height_mm, dpi)
+    plan = layout_letter(greeting, body, signoff, width_px // 2, height_px, x_offset=width_px // 2)
+    
+    # Create PDF
+    c = canvas.Canvas(output_pdf, pagesize=(width_pt, height_pt))
+    
+    # Page 1: Add the image (e.g., last page)
+    c.drawImage(png1_path, 0, 0, width_pt, height_pt)
+    c.showPage()
+    
+    # Page 2: Draw the letter text
+    render_layout_pdf(c, plan, scale=width_pt / width_px)
+    c.showPage()
+    
+    # Save the PDF
+    c.save()
+    
+    logging.info(f"Created PDF: {output_pdf} with 2 pages, the letter as vector text at font size {plan['font_size']}, "
+          f"each {width_pt}x{height_pt} points ({width_mm}mm x {height_mm}mm)")
+    return output_pdf
+
 def generate_card_pdf(greeting, body, signoff, thumbnail, last_page, final_filename="output.pdf", bucket_name = config['AWS']['bucket_name']):
     """
     Generates a custom greeting card in PDF format with a given greeting, body, and signoff text,
@@ -177,10 +227,18 @@ def generate_card_pdf(greeting, body, signoff, thumbnail, last_page, final_filen
         logging.info(f"Last page is not a valid path or URL. Using default last page: {last_page}")
 
 
-    output_page_02 = create_letter_png_with_blank_page(greeting, body, signoff, output_path="output-page-02.png", width_mm=127, height_mm=177.8, dpi=300)
     output_page_01 = concatenate_images(last_page, thumbnail, output_path="output-page-01.png", width_mm=127, height_mm=177.8, dpi=300)
 
-    final_filename = pngs_to_pdf(output_page_01, output_page_02, output_pdf="output.pdf", width_mm=127 * 2, height_mm=177.8)
+    vector_text = CARD_PDF_LETTER_TEXT == "vector"
+    if vector_text:
+        try:
+            final_filename = letter_to_pdf(output_page_01, greeting, body, signoff, output_pdf="output.pdf", width_mm=127 * 2, height_mm=177.8, dpi=300)
+        except Exception as e:
+            logging.error(f"Failed to draw the letter as vector text, rasterizing it instead: {e}")
+            vector_text = False
+    if not vector_text:
+        output_page_02 = create_letter_png_with_blank_page(greeting, body, signoff, output_path="output-page-02.png", width_mm=127, height_mm=177.8, dpi=300)
+        final_filename = pngs_to_pdf(output_page_01, output_page_02, output_pdf="output.pdf", width_mm=127 * 2, height_mm=177.8)
 
     # Define the file you want to upload
     local_file = final_filename
@@ -0,0 +1,168 @@
+from collections import deque
+import threading
+import logging
+import asyncio
+
+from ai_module.utils.llm_client import get_background_loop, circuit_breaker, LLM_CIRCUIT_BREAKER_ENABLED
+from ai_module.utils.occasions import lookup_occasion, normalize_key
+
+
+def parse_combinations(value):
+    """
+    Parses the configured combinations, e.g. "Christmas|Mother|female; Birthday|Friend|any".
+
+    Returns:
+    list: (occasion, relationship, gender) tuples. Gender "any" matches every request.
+    """
+    combinations = []
+    for item in value.split(';'):
+        parts = [part.strip() for part in item.split('|')]
+        if len(parts) == 2:
+            parts.append('any')
+        if len(parts) != 3 or not all(parts):
+            if item.strip():
+                logging.error(f"Ignoring malformed variant pool combination: '{item}'")
+            continue
+        combinations.append(tuple(parts))
+    return combinations
+
+
+class VariantPool:
+    """
+    Pool of ready-to-serve message sets per occasion x relationship (x gender) combination,
+    kept full by a background worker on the shared event loop.
+
+    The worker pauses while the LLM circuit is open and backs off exponentially while
+    refills keep failing, so a failing upstream is not called every refill_interval.
+    """
+
+    def __init__(self, generate, combinations, pool_size=20, refill_interval=1.0, concurrency=4, max_backoff=60.0):
+        """
+        Args:
+        generate (coroutine function): Called as generate(occasion, relationship, gender), returns a message set.
+        combinations (list): (occasion, relationship, gender) tuples to keep pools for.
+        pool_size (int): Target number of ready message sets per combination.
+        refill_interval (float): Minimum seconds between starting two refill generations.
+        concurrency (int): Maximum refill generations in flight.
+        max_backoff (float): Longest wait between refills after consecutive failures, in seconds.
+        """
+        self.generate = generate
+        self.pool_size = pool_size
+        self.refill_interval = refill_interval
+        self.concurrency = concurrency
+        self.max_backoff = max_backoff
+        self.combinations = {}
+        for occasion, relationship, gender in combinations:
+            occasion = lookup_occasion(occasion)['name']
+            self.combinations[self._key(occasion, relationship, gender)] = (occasion, relationship, gender)
+        self._pools = {key: deque() for key in self.combinations}
+        self._in_flight = {key: 0 for key in self.combinations}
+        self._lock = threading.Lock()
+        self._tasks = set()
+        self._future = None
+        self._consecutive_failures = 0
+        self.stats = {"served": 0, "empty": 0, "generated": 0, "failed": 0, "paused": 0}
+
+    @staticmethod
+    def _key(occasion, relationship, gender):
+        return occasion, normalize_key(relationship), normalize_key(gender)
+
+    def pop(self, occasion, relationship, gender):
+        """
+        Takes one ready message set for the request, or returns None when the combination
+        is not pooled or its pool is currently empty.
+
+        Args:
+        occasion (str): Canonical occasion name.
+        relationship (str): The relationship with the person.
+        gender (str): The gender of the person.
+        """
+        with self._lock:
+            for key in (self._key(occasion, relationship, gender), self._key(occasion, relationship, 'any')):
+                pool = self._pools.get(key)
+                if pool is None:
+                    continue
+                if pool:
+                    self.stats["served"] += 1
+                    return pool.popleft()
+                self.stats["empty"] += 1
+                return None
+            return None
+
+    async def _refill(self, key, semaphore):
+        occasion, relationship, gender = self.combinations[key]
+        try:
+            messages = await self.generate(occasion, relationship, gender)
+            with self._lock:
+                if any(messages):
+                    self._pools[key].append(messages)
+                    self.stats["generated"] += 1
+                    self._consecutive_failures = 0
+                else:
+                    self.stats["failed"] += 1
+                    self._consecutive_failures += 1
+        except Exception as e:
+            logging.error(f"Variant pool refill failed for {key}: {e}")
+            with self._lock:
+                self.stats["failed"] += 1
+                self._consecutive_failures += 1
+        finally:
+            with self._lock:
+                self._in_flight[key] -= 1
+            semaphore.release()
+
+    async def run(self):
+        """
+        Refills every pool up to pool_size, forever, respecting the refill rate and concurrency.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while True:
+            with self._lock:
+                deficits = [key for key, pool in self._pools.items()
+                            if len(pool) + self._in_flight[key] < self.pool_size]
+            if not deficits:
+                await asyncio.sleep(self.refill_interval)
+                continue
+            for key in deficits:
+                if self._upstream_open():
+                    await asyncio.sleep(self.refill_interval)
+                    break
+                await semaphore.acquire()
+                with self._lock:
+                    self._in_flight[key] += 1
+                task = asyncio.create_task(self._refill(key, semaphore))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                await asyncio.sleep(self._refill_delay())
+
+    def _upstream_open(self):
+        # Pool refills are optional work, so they wait out an open circuit instead of being rejected
+        if LLM_CIRCUIT_BREAKER_ENABLED and circuit_breaker.is_open():
+            with self._lock:
+                self.stats["paused"] += 1
+            return True
+        return False
+
+    def _refill_delay(self):
+        with self._lock:
+            failures = self._consecutive_failures
+        if not failures:
+            return self.refill_interval
+        return min(self.max_backoff, self.refill_interval * 2 ** min(failures, 16))
+
+    def start(self):
+        """
+        Starts the refill worker on the shared background event loop. Safe to call more than once.
+        """
+        if self._future is None and self.combinations:
+            logging.info(f"Starting variant pool worker for {len(self.combinations)} combination(s)")
+            self._future = asyncio.run_coroutine_threadsafe(self.run(), get_background_loop())
+
+    def snapshot(self):
+        """
+        Returns the counters and the current size of every pool.
+        """
+        with self._lock:
+            sizes = {" / ".join(key): len(pool) for key, pool in self._pools.items()}
+            return dict(self.stats, pools=sizes, pool_size=self.pool_size,
+                        consecutive_failures=self._consecutive_failures)